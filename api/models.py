@@ -2,9 +2,15 @@
 Pydantic Models for API Request/Response validation.
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+from typing_extensions import NotRequired, TypedDict
+
+
+# Shared by the models that are actually built per request: request bodies
+# parsed by FastAPI and CollectionStats. Nothing mutates them afterwards.
+_FROZEN_MODEL_CONFIG = ConfigDict(extra="ignore", frozen=True)
 
 
 # ===========================================
@@ -13,6 +19,8 @@ from datetime import datetime
 
 class QueryRequest(BaseModel):
     """Request model for RAG query."""
+    model_config = _FROZEN_MODEL_CONFIG
+    
     query: str = Field(
         ..., 
         min_length=1, 
@@ -33,10 +41,16 @@ class QueryRequest(BaseModel):
         default=None,
         description="Filter results by source name"
     )
+    stream: bool = Field(
+        default=False,
+        description="Stream the answer as server-sent events"
+    )
 
 
 class DocumentInput(BaseModel):
     """Single document for indexing."""
+    model_config = _FROZEN_MODEL_CONFIG
+    
     source: str = Field(
         ..., 
         min_length=1,
@@ -52,13 +66,15 @@ class DocumentInput(BaseModel):
         description="Source URL"
     )
     metadata: Optional[Dict[str, Any]] = Field(
-        default={},
-        description="Additional metadata"
+        default=None,
+        description="Additional metadata (None is treated as empty)"
     )
 
 
 class IndexRequest(BaseModel):
     """Request model for document indexing."""
+    model_config = _FROZEN_MODEL_CONFIG
+    
     documents: List[DocumentInput] = Field(
         ..., 
         min_length=1,
@@ -68,6 +84,8 @@ class IndexRequest(BaseModel):
 
 class SearchRequest(BaseModel):
     """Request model for document search."""
+    model_config = _FROZEN_MODEL_CONFIG
+    
     query: str = Field(
         ..., 
         min_length=1,
@@ -83,6 +101,8 @@ class SearchRequest(BaseModel):
 
 class DeleteDocumentRequest(BaseModel):
     """Request model for document deletion."""
+    model_config = _FROZEN_MODEL_CONFIG
+    
     document_id: str = Field(
         ..., 
         description="Document ID to delete"
@@ -93,7 +113,10 @@ class DeleteDocumentRequest(BaseModel):
 # Response Models
 # ===========================================
 
-class SourceInfo(BaseModel):
+# Per-item output shapes are plain dicts built from trusted internal data;
+# they are TypedDicts so no model is constructed per source/result.
+
+class SourceInfo(TypedDict):
     """Source document information."""
     source: str
     url: str
@@ -112,13 +135,13 @@ class QueryResponse(BaseModel):
     status: str
 
 
-class IndexResult(BaseModel):
+class IndexResult(TypedDict):
     """Result of single document indexing."""
     status: str
     source: str
-    document_id: Optional[str] = None
-    chunks_indexed: Optional[int] = 0
-    message: Optional[str] = None
+    document_id: NotRequired[str]
+    chunks_indexed: NotRequired[int]
+    message: NotRequired[str]
 
 
 class IndexResponse(BaseModel):
@@ -130,7 +153,7 @@ class IndexResponse(BaseModel):
     details: List[IndexResult]
 
 
-class SearchResult(BaseModel):
+class SearchResult(TypedDict):
     """Single search result."""
     text: str
     source: str
@@ -149,6 +172,8 @@ class SearchResponse(BaseModel):
 
 class CollectionStats(BaseModel):
     """Collection statistics response."""
+    model_config = _FROZEN_MODEL_CONFIG
+    
     collection_name: str
     vector_count: int
     document_count: int
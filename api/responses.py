@@ -0,0 +1,37 @@
+"""
+Custom Response Classes for RAG Chatbot API.
+"""
+
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+def _orjson_default(obj: Any) -> Any:
+    """Serialize values orjson does not handle natively (e.g. numpy scalars)."""
+    import numpy as np
+    
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class FastORJSONResponse(ORJSONResponse):
+    """
+    ORJSONResponse that serializes numpy values in C.
+    
+    Retrieval scores and vectors can arrive as numpy types; OPT_SERIALIZE_NUMPY
+    lets orjson encode them natively, with a default hook as a fallback.
+    """
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_orjson_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
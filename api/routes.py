@@ -3,10 +3,15 @@ API Routes for RAG Chatbot.
 FastAPI endpoints for querying, indexing, and managing documents.
 """
 
-from fastapi import APIRouter, HTTPException, status, BackgroundTasks, File, UploadFile
-from typing import Optional, List
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Request, status, File, UploadFile
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import BinaryIO, AsyncIterator
+from datetime import datetime, timezone
+import logging
 import os
+import time
+import orjson
 
 from api.models import (
     QueryRequest,
@@ -18,56 +23,64 @@ from api.models import (
     DeleteDocumentRequest,
     CollectionStats,
     HealthResponse,
-    ChatHistoryResponse,
-    ErrorResponse
+    ChatHistoryResponse
 )
+from api.responses import FastORJSONResponse
 from rag.indexing import RAGIndexer
 from rag.retrieval import RAGRetriever
 from rag.utils import extract_text_from_pdf, extract_text_from_docx
 from config.logging_config import get_logger
-from config.settings import settings
+from config.constants import MAX_FILE_SIZE_MB
 
 logger = get_logger(__name__)
 
-router = APIRouter()
+router = APIRouter(default_response_class=FastORJSONResponse)
 
-# Initialize RAG components (lazy loading)
-_indexer: Optional[RAGIndexer] = None
-_retriever: Optional[RAGRetriever] = None
 
+# RAG components are created once in the application lifespan
+def get_indexer(request: Request) -> RAGIndexer:
+    """Get the RAGIndexer instance created at startup."""
+    return request.app.state.indexer
 
-def get_indexer() -> RAGIndexer:
-    """Get or create RAGIndexer instance."""
-    global _indexer
-    if _indexer is None:
-        _indexer = RAGIndexer()
-    return _indexer
 
-
-def get_retriever() -> RAGRetriever:
-    """Get or create RAGRetriever instance."""
-    global _retriever
-    if _retriever is None:
-        _retriever = RAGRetriever()
-    return _retriever
+def get_retriever(request: Request) -> RAGRetriever:
+    """Get the RAGRetriever instance created at startup."""
+    return request.app.state.retriever
 
 
 # ===========================================
 # Health & Status Endpoints
 # ===========================================
 
+# Prebuilt health payload; only the timestamp varies per request
+_HEALTH_TEMPLATE = b'{"status":"healthy","version":"1.0.0","timestamp":"%s"}'
+
+# [epoch second, encoded ISO timestamp] refreshed at most once per second
+_ts_cache = [0, b""]
+
+
+def _health_timestamp() -> bytes:
+    """Get the current UTC timestamp at one-second resolution."""
+    sec = int(time.time())
+    if sec != _ts_cache[0]:
+        # Naive ISO format, as before; only the deprecated utcfromtimestamp is avoided
+        utc = datetime.fromtimestamp(sec, timezone.utc).replace(tzinfo=None)
+        _ts_cache[:] = [sec, utc.isoformat().encode()]
+    return _ts_cache[1]
+
+
 @router.get(
     "/health",
-    response_model=HealthResponse,
+    response_model=None,
+    responses={200: {"model": HealthResponse}},
     tags=["Health"],
     summary="Health check endpoint"
 )
 async def health_check():
     """Check if the API is running and healthy."""
-    return HealthResponse(
-        status="healthy",
-        version="1.0.0",
-        timestamp=datetime.utcnow().isoformat()
+    return Response(
+        content=_HEALTH_TEMPLATE % _health_timestamp(),
+        media_type="application/json"
     )
 
 
@@ -77,14 +90,13 @@ async def health_check():
     tags=["Health"],
     summary="Get collection statistics"
 )
-async def get_stats():
+async def get_stats(indexer: RAGIndexer = Depends(get_indexer)):
     """Get statistics about the indexed document collection."""
     try:
-        indexer = get_indexer()
         stats = await indexer.get_collection_stats()
         return CollectionStats(**stats)
     except Exception as e:
-        logger.error(f"Error getting stats: {e}")
+        logger.error("Error getting stats: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -95,13 +107,23 @@ async def get_stats():
 # Query Endpoints
 # ===========================================
 
+async def _stream_query_events(events: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    """Frame streaming query events as server-sent events."""
+    async for event in events:
+        yield b"data: " + orjson.dumps(event) + b"\n\n"
+
+
 @router.post(
     "/query",
-    response_model=QueryResponse,
+    response_model=None,
+    responses={200: {"model": QueryResponse}},
     tags=["Query"],
     summary="Query the RAG system"
 )
-async def query_documents(request: QueryRequest):
+async def query_documents(
+    request: QueryRequest,
+    retriever: RAGRetriever = Depends(get_retriever)
+):
     """
     Query the RAG system with a question.
     
@@ -109,11 +131,30 @@ async def query_documents(request: QueryRequest):
     1. Retrieves relevant documents using semantic search
     2. Generates an answer using the LLM
     3. Returns the answer with source citations
+    
+    With `stream` set, the answer is sent as server-sent events: sources
+    first, then token deltas, then a final "done" event.
     """
     try:
-        logger.info(f"Received query: {request.query[:50]}...")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Received query: %s...", request.query[:50])
+        
+        if request.stream:
+            events = await retriever.query(
+                user_query=request.query,
+                session_id=request.session_id,
+                top_k=request.top_k,
+                filter_source=request.filter_source,
+                stream=True
+            )
+            # An explicit Content-Encoding makes GZipMiddleware pass the stream
+            # through; it would otherwise buffer events until the end
+            return StreamingResponse(
+                _stream_query_events(events),
+                media_type="text/event-stream",
+                headers={"Content-Encoding": "identity", "Cache-Control": "no-cache"}
+            )
         
-        retriever = get_retriever()
         result = await retriever.query(
             user_query=request.query,
             session_id=request.session_id,
@@ -121,27 +162,19 @@ async def query_documents(request: QueryRequest):
             filter_source=request.filter_source
         )
         
-        # Convert to response model
-        return QueryResponse(
-            answer=result["answer"],
-            sources=[
-                {
-                    "source": s["source"],
-                    "url": s["url"],
-                    "text": s["text"],
-                    "score": s["score"],
-                    "chunk_index": s["chunk_index"]
-                }
-                for s in result.get("sources", [])
-            ],
-            query=result["query"],
-            documents_retrieved=result.get("documents_retrieved", 0),
-            processing_time_ms=result["processing_time_ms"],
-            status=result["status"]
-        )
+        # Serialize directly, skipping response model validation;
+        # the retriever already emits sources in SourceInfo shape
+        return FastORJSONResponse(content={
+            "answer": result["answer"],
+            "sources": result.get("sources", []),
+            "query": result["query"],
+            "documents_retrieved": result.get("documents_retrieved", 0),
+            "processing_time_ms": result["processing_time_ms"],
+            "status": result["status"]
+        })
         
     except Exception as e:
-        logger.error(f"Query error: {e}")
+        logger.error("Query error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -150,30 +183,43 @@ async def query_documents(request: QueryRequest):
 
 @router.post(
     "/search",
-    response_model=SearchResponse,
+    response_model=None,
+    responses={200: {"model": SearchResponse}},
     tags=["Query"],
     summary="Search for similar documents"
 )
-async def search_documents(request: SearchRequest):
+async def search_documents(
+    request: SearchRequest,
+    retriever: RAGRetriever = Depends(get_retriever)
+):
     """
     Search for documents similar to the query.
     Returns matching document chunks without generating an LLM response.
     """
     try:
-        retriever = get_retriever()
         results = await retriever.search_similar_documents(
             query=request.query,
             top_k=request.top_k
         )
         
-        return SearchResponse(
-            results=results,
-            query=request.query,
-            total_results=len(results)
-        )
+        return FastORJSONResponse(content={
+            "results": [
+                {
+                    "text": r["text"],
+                    "source": r["source"],
+                    "url": r["url"],
+                    "score": r["score"],
+                    "document_id": r["document_id"],
+                    "chunk_index": r["chunk_index"]
+                }
+                for r in results
+            ],
+            "query": request.query,
+            "total_results": len(results)
+        })
         
     except Exception as e:
-        logger.error(f"Search error: {e}")
+        logger.error("Search error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -186,11 +232,15 @@ async def search_documents(request: SearchRequest):
 
 @router.post(
     "/index",
-    response_model=IndexResponse,
+    response_model=None,
+    responses={200: {"model": IndexResponse}},
     tags=["Indexing"],
     summary="Index documents"
 )
-async def index_documents(request: IndexRequest):
+async def index_documents(
+    request: IndexRequest,
+    indexer: RAGIndexer = Depends(get_indexer)
+):
     """
     Index one or more documents into the RAG system.
     
@@ -200,20 +250,28 @@ async def index_documents(request: IndexRequest):
     3. Stored in the vector database
     """
     try:
-        logger.info(f"Indexing {len(request.documents)} documents")
+        logger.info("Indexing %s documents", len(request.documents))
         
         # Convert to dict format
-        documents = [doc.model_dump() for doc in request.documents]
+        documents = [
+            {
+                "source": doc.source,
+                "content": doc.content,
+                "url": doc.url,
+                "metadata": doc.metadata
+            }
+            for doc in request.documents
+        ]
         
-        indexer = get_indexer()
         result = await indexer.index_documents(documents)
         
-        return IndexResponse(
-            total=result["total"],
-            successful=result["successful"],
-            failed=result["failed"],
-            total_chunks=result["total_chunks"],
-            details=[
+        # Indexer output is trusted, so serialize it without a response model
+        return FastORJSONResponse(content={
+            "total": result["total"],
+            "successful": result["successful"],
+            "failed": result["failed"],
+            "total_chunks": result["total_chunks"],
+            "details": [
                 {
                     "status": d["status"],
                     "source": d.get("source", ""),
@@ -223,16 +281,42 @@ async def index_documents(request: IndexRequest):
                 }
                 for d in result["details"]
             ]
-        )
+        })
         
     except Exception as e:
-        logger.error(f"Indexing error: {e}")
+        logger.error("Indexing error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
 
 
+# Constant upload error bodies, serialized once in FastAPI's {"detail": ...} shape
+_FILE_TOO_LARGE_BODY = orjson.dumps(
+    {"detail": f"File exceeds maximum size of {MAX_FILE_SIZE_MB} MB."}
+)
+_EMPTY_TEXT_BODY = orjson.dumps({"detail": "Empty text extracted from document."})
+
+
+def _read_text_file(file_data: BinaryIO) -> str:
+    """Read a plain text or Markdown upload."""
+    return file_data.read().decode("utf-8")
+
+
+# Text extractors for supported upload types
+_EXTRACTORS_BY_EXTENSION = {
+    ".pdf": extract_text_from_pdf,
+    ".docx": extract_text_from_docx,
+    ".txt": _read_text_file,
+    ".md": _read_text_file
+}
+
+_EXTRACTORS_BY_CONTENT_TYPE = {
+    "application/pdf": extract_text_from_pdf,
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": extract_text_from_docx
+}
+
+
 @router.post(
     "/upload",
     tags=["Indexing"],
@@ -248,29 +332,41 @@ async def upload_file(file: UploadFile = File(...)):
         filename = file.filename
         file_extension = os.path.splitext(filename)[1].lower() if filename else ""
         
-        # Read file bytes
-        file_bytes = await file.read()
-        text = ""
-
-        if file_extension == ".pdf" or content_type == "application/pdf":
-            logger.info(f"Extracting text from PDF: {filename}")
-            text = extract_text_from_pdf(file_bytes)
-        elif file_extension == ".docx" or content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            logger.info(f"Extracting text from DOCX: {filename}")
-            text = extract_text_from_docx(file_bytes)
-        elif file_extension in [".txt", ".md"] or "text/" in content_type:
-            logger.info(f"Reading text file: {filename}")
-            text = file_bytes.decode("utf-8")
-        else:
+        # Reject oversized uploads before touching their content
+        file_size = file.size
+        if file_size is None:
+            file_size = file.file.seek(0, os.SEEK_END)
+        if file_size > MAX_FILE_SIZE_MB * 1024 * 1024:
+            return Response(
+                content=_FILE_TOO_LARGE_BODY,
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                media_type="application/json"
+            )
+        
+        # Extract from the spooled upload file instead of buffering it in memory
+        file_stream = file.file
+        file_stream.seek(0)
+
+        # Dispatch on extension first, then fall back to the content type
+        extractor = _EXTRACTORS_BY_EXTENSION.get(file_extension)
+        if extractor is None:
+            extractor = _EXTRACTORS_BY_CONTENT_TYPE.get(content_type)
+        if extractor is None and content_type and content_type.startswith("text/"):
+            extractor = _read_text_file
+        if extractor is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Unsupported file type: {content_type}. Please upload PDF, DOCX, TXT, or MD."
             )
+        
+        logger.info("Extracting text from %s: %s", file_extension or content_type, filename)
+        text = await run_in_threadpool(extractor, file_stream)
 
         if not text:
-            raise HTTPException(
+            return Response(
+                content=_EMPTY_TEXT_BODY,
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                detail="Empty text extracted from document."
+                media_type="application/json"
             )
 
         return {
@@ -283,7 +379,7 @@ async def upload_file(file: UploadFile = File(...)):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Upload error: {e}")
+        logger.error("Upload error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -295,10 +391,12 @@ async def upload_file(file: UploadFile = File(...)):
     tags=["Indexing"],
     summary="Delete a document"
 )
-async def delete_document(document_id: str):
+async def delete_document(
+    document_id: str,
+    indexer: RAGIndexer = Depends(get_indexer)
+):
     """Delete a document and all its chunks from the index."""
     try:
-        indexer = get_indexer()
         result = await indexer.delete_document(document_id)
         
         if result["status"] == "error":
@@ -312,7 +410,7 @@ async def delete_document(document_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Delete error: {e}")
+        logger.error("Delete error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -323,26 +421,45 @@ async def delete_document(document_id: str):
 # Chat History Endpoints
 # ===========================================
 
+def _history_entry(entry: dict) -> dict:
+    """Project a stored chat history entry onto the ChatHistoryEntry shape."""
+    return {
+        "query": entry.get("query", ""),
+        "answer": entry.get("answer", ""),
+        "sources": entry.get("sources", []),
+        "timestamp": entry.get("timestamp"),
+        "processing_time_ms": entry.get("processing_time_ms", 0)
+    }
+
+
 @router.get(
     "/history/{session_id}",
-    response_model=ChatHistoryResponse,
+    response_model=None,
+    responses={200: {"model": ChatHistoryResponse}},
     tags=["History"],
     summary="Get chat history"
 )
-async def get_chat_history(session_id: str, limit: int = 10):
+async def get_chat_history(
+    session_id: str,
+    limit: int = 10,
+    retriever: RAGRetriever = Depends(get_retriever)
+):
     """Retrieve chat history for a specific session."""
     try:
-        retriever = get_retriever()
         history = await retriever.get_chat_history(session_id, limit)
         
-        return ChatHistoryResponse(
-            session_id=session_id,
-            history=history,
-            total_entries=len(history)
+        # History is capped by limit, so one orjson pass beats streaming it
+        return Response(
+            content=orjson.dumps({
+                "session_id": session_id,
+                "history": [_history_entry(entry) for entry in history],
+                "total_entries": len(history)
+            }),
+            media_type="application/json"
         )
         
     except Exception as e:
-        logger.error(f"History retrieval error: {e}")
+        logger.error("History retrieval error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -9,6 +9,10 @@ Static values that don't change based on environment.
 VECTOR_DIMENSION = 1536  # text-embedding-3-small dimension
 VECTOR_METRIC = "Cosine"
 
+# INT8 scalar quantization; top hits are rescored against the original vectors
+QUANTIZATION_QUANTILE = 0.99
+QUANTIZATION_OVERSAMPLING = 2.0
+
 # ===========================================
 # Response Configuration
 # ===========================================
@@ -30,12 +34,34 @@ EMBEDDING_TIMEOUT = 30
 LLM_TIMEOUT = 60
 MONGODB_TIMEOUT = 10000  # milliseconds
 
+# ===========================================
+# HTTP Connection Pool
+# ===========================================
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE = 50
+
 # ===========================================
 # File Processing
 # ===========================================
 SUPPORTED_FILE_TYPES = [".txt", ".pdf", ".docx", ".md"]
 MAX_FILE_SIZE_MB = 10
 MAX_CONTENT_LENGTH = 100000  # characters
+PDF_MAX_PAGES_PER_SLAB = 500  # pages extracted and held in memory at once
+
+# ===========================================
+# Embedding Batching
+# ===========================================
+EMBED_BATCH_MAX_CHARS = 250000  # characters per embedding request
+
+# ===========================================
+# MongoDB Batching
+# ===========================================
+METADATA_FLUSH_SIZE = 500  # buffered metadata upserts per bulk_write
+
+# ===========================================
+# Qdrant Batching
+# ===========================================
+UPSERT_BATCH_SIZE = 256  # points per upsert request
 
 # ===========================================
 # System Prompts
@@ -61,6 +87,18 @@ USER QUESTION: {question}
 
 Please provide a helpful and accurate answer based only on the context above. If the context doesn't contain enough information to answer the question, say so clearly."""
 
+# ===========================================
+# Collection Names (Qdrant)
+# ===========================================
+QUERY_CACHE_COLLECTION = "query_cache"
+
+# Payload fields indexed for filtering, with their Qdrant schema types
+DOCUMENT_PAYLOAD_INDEXES = {"source": "keyword", "document_id": "keyword"}
+QUERY_CACHE_PAYLOAD_INDEXES = {"filter_source": "keyword", "ts": "float"}
+
+# Payload fields returned with each search hit
+RETRIEVAL_PAYLOAD_FIELDS = ["text", "source", "url", "document_id", "chunk_index", "metadata"]
+
 # ===========================================
 # Collection Names (MongoDB)
 # ===========================================
@@ -68,6 +106,10 @@ DOCUMENTS_COLLECTION = "documents"
 CHAT_HISTORY_COLLECTION = "chat_history"
 METADATA_COLLECTION = "metadata"
 
+# Compound index serving per-session history lookups, newest first
+CHAT_HISTORY_INDEX = "session_id_1_timestamp_-1"
+CHAT_HISTORY_INDEX_KEYS = [("session_id", 1), ("timestamp", -1)]
+
 # ===========================================
 # API Response Messages
 # ===========================================
@@ -63,6 +63,11 @@ class Settings(BaseSettings):
         default=8000,
         description="Application port"
     )
+    app_workers: int = Field(
+        default=0,
+        ge=0,
+        description="Uvicorn worker processes (0 = one per CPU)"
+    )
     debug: bool = Field(
         default=False,
         description="Debug mode"
@@ -121,6 +126,57 @@ class Settings(BaseSettings):
         ge=0,
         description="Overlap between text chunks"
     )
+    chunking_use_cdc: bool = Field(
+        default=False,
+        description="Cut chunks at content-defined boundaries so edits only move nearby chunks"
+    )
+    
+    # ===========================================
+    # Performance Configuration
+    # ===========================================
+    max_concurrent_docs: int = Field(
+        default=8,
+        ge=1,
+        description="Maximum documents indexed concurrently in a batch"
+    )
+    embed_batch_size: int = Field(
+        default=96,
+        ge=1,
+        description="Maximum texts per embedding API request"
+    )
+    embed_concurrency: int = Field(
+        default=8,
+        ge=1,
+        description="Maximum concurrent embedding API requests"
+    )
+    query_emb_cache_size: int = Field(
+        default=4096,
+        ge=0,
+        description="Maximum cached query embeddings (0 disables the cache)"
+    )
+    semantic_cache_enabled: bool = Field(
+        default=False,
+        description="Serve answers for near-duplicate queries from the Qdrant response cache"
+    )
+    semantic_cache_threshold: float = Field(
+        default=0.92,
+        ge=0.0,
+        le=1.0,
+        description="Minimum query similarity for a response cache hit"
+    )
+    semantic_cache_ttl_seconds: int = Field(
+        default=86400,
+        ge=1,
+        description="Lifetime of cached responses in seconds"
+    )
+    embedding_cache_enabled: bool = Field(
+        default=False,
+        description="Reuse chunk embeddings from an on-disk SQLite cache"
+    )
+    embedding_cache_path: str = Field(
+        default="data/embedding_cache.sqlite3",
+        description="SQLite file backing the embedding cache"
+    )
     
     class Config:
         env_file = ".env"
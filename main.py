@@ -3,13 +3,23 @@ RAG Chatbot - Main Application Entry Point.
 FastAPI application with CORS support for frontend integration.
 """
 
+import asyncio
+import os
+import orjson
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
-from api.routes import router, get_indexer, get_retriever
+from api.routes import router
+from api.responses import FastORJSONResponse
+from rag.indexing import RAGIndexer
+from rag.retrieval import RAGRetriever
+from rag.clients import close_clients
+from rag.utils import start_pdf_pool, shutdown_pdf_pool, load_token_encoder
 from config.settings import settings
 from config.logging_config import setup_logging, get_logger
 
@@ -18,6 +28,13 @@ setup_logging(log_level=settings.log_level)
 logger = get_logger(__name__)
 
 
+def _worker_count() -> int:
+    """Number of uvicorn worker processes serving the app."""
+    if settings.debug:
+        return 1
+    return settings.app_workers or os.cpu_count() or 1
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator:
     """
@@ -27,29 +44,43 @@ async def lifespan(app: FastAPI) -> AsyncGenerator:
     # Startup
     logger.info("=" * 50)
     logger.info("RAG Chatbot API Starting...")
-    logger.info(f"Debug Mode: {settings.debug}")
-    logger.info(f"LLM Model: {settings.llm_model}")
-    logger.info(f"Embedding Model: {settings.embedding_model}")
+    logger.info("Debug Mode: %s", settings.debug)
+    logger.info("LLM Model: %s", settings.llm_model)
+    logger.info("Embedding Model: %s", settings.embedding_model)
     logger.info("=" * 50)
     
-    # Initialize components on startup (optional - can be lazy loaded)
+    # Initialize components once on startup; fail fast if unavailable
     try:
-        indexer = get_indexer()
-        retriever = get_retriever()
+        app.state.indexer = RAGIndexer()
+        app.state.retriever = RAGRetriever()
+        await app.state.indexer.initialize()
+        await app.state.retriever.initialize()
+        
+        # May download the tiktoken BPE file; keep it off the event loop
+        await asyncio.to_thread(load_token_encoder)
+        
+        # Split the CPUs between uvicorn workers, but keep at least two
+        # extraction processes on multi-core hosts so the default one-worker-
+        # per-CPU deployment still parallelizes; processes spawn on first use
+        cpus = os.cpu_count() or 1
+        start_pdf_pool(max(2, cpus // _worker_count()) if cpus > 1 else 1)
         logger.info("RAG components initialized successfully")
     except Exception as e:
-        logger.error(f"Failed to initialize RAG components: {e}")
-        # Don't raise - let the app start and handle errors per-request
+        logger.error("Failed to initialize RAG components: %s", e)
+        raise
     
     yield
     
     # Shutdown
     logger.info("RAG Chatbot API Shutting down...")
     try:
-        get_indexer().close()
-        get_retriever().close()
+        await app.state.indexer.close()
+        await app.state.retriever.close()
+        shutdown_pdf_pool()
+        # Close shared clients last so pending history writes can land
+        await close_clients()
     except Exception as e:
-        logger.error(f"Error during shutdown: {e}")
+        logger.error("Error during shutdown: %s", e)
 
 
 # Create FastAPI application
@@ -73,6 +104,7 @@ app = FastAPI(
     """,
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=FastORJSONResponse,
     docs_url="/docs",
     redoc_url="/redoc"
 )
@@ -86,28 +118,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON responses (sources, history) for clients that accept gzip
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Include API routes
 app.include_router(router, prefix="/api/v1")
 
 
-# Root endpoint
+# Root endpoint payload never changes, so serialize it once
+_ROOT_RESPONSE_BODY = orjson.dumps({
+    "name": "RAG Chatbot API",
+    "version": "1.0.0",
+    "status": "running",
+    "docs": "/docs",
+    "health": "/api/v1/health"
+})
+
+
 @app.get("/", tags=["Root"])
 async def root():
     """Root endpoint with API information."""
-    return {
-        "name": "RAG Chatbot API",
-        "version": "1.0.0",
-        "status": "running",
-        "docs": "/docs",
-        "health": "/api/v1/health"
-    }
+    return Response(content=_ROOT_RESPONSE_BODY, media_type="application/json")
 
 
 if __name__ == "__main__":
+    # "auto" picks uvloop/httptools when installed (not on Windows);
+    # reload requires one worker
     uvicorn.run(
         "main:app",
         host=settings.app_host,
         port=settings.app_port,
         reload=settings.debug,
+        workers=_worker_count(),
+        loop="auto",
+        http="auto",
+        access_log=settings.debug,
         log_level=settings.log_level.lower()
     )
@@ -0,0 +1,82 @@
+"""
+Shared Client Module.
+Lazily creates one OpenAI, Qdrant, and MongoDB client per process so the
+indexer and retriever share connection pools.
+"""
+
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+from qdrant_client import AsyncQdrantClient
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from config.settings import settings
+from config.constants import LLM_TIMEOUT, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+_openai_client: Optional[AsyncOpenAI] = None
+_qdrant_client: Optional[AsyncQdrantClient] = None
+_mongo_client: Optional[AsyncIOMotorClient] = None
+
+
+def get_openai() -> AsyncOpenAI:
+    """Return the shared OpenAI client (configured for OpenRouter)."""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = AsyncOpenAI(
+            api_key=settings.openrouter_api_key,
+            base_url=settings.openrouter_base_url,
+            timeout=LLM_TIMEOUT,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE
+                ),
+                timeout=LLM_TIMEOUT,
+                http2=True
+            )
+        )
+    return _openai_client
+
+
+def get_qdrant() -> AsyncQdrantClient:
+    """Return the shared Qdrant client."""
+    global _qdrant_client
+    if _qdrant_client is None:
+        _qdrant_client = AsyncQdrantClient(
+            url=settings.qdrant_url,
+            api_key=settings.qdrant_api_key,
+            timeout=30
+        )
+    return _qdrant_client
+
+
+def get_mongo() -> AsyncIOMotorClient:
+    """Return the shared MongoDB client."""
+    global _mongo_client
+    if _mongo_client is None:
+        _mongo_client = AsyncIOMotorClient(settings.mongo_uri)
+    return _mongo_client
+
+
+async def close_clients():
+    """Close all shared clients. Safe to call more than once."""
+    global _openai_client, _qdrant_client, _mongo_client
+    
+    try:
+        if _qdrant_client is not None:
+            await _qdrant_client.close()
+        if _mongo_client is not None:
+            _mongo_client.close()
+        if _openai_client is not None:
+            await _openai_client.close()
+        logger.info("Shared client connections closed")
+    except Exception as e:
+        logger.error("Error closing connections: %s", e)
+    finally:
+        _openai_client = None
+        _qdrant_client = None
+        _mongo_client = None
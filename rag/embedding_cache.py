@@ -0,0 +1,107 @@
+"""
+Embedding Cache Module.
+Persists chunk embeddings on disk in SQLite so re-indexing unchanged text
+does not call the embedding API again.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# SQLite's default limit on bound parameters per statement is 999
+_MAX_SQL_PARAMS = 900
+
+
+class EmbeddingCache:
+    """
+    On-disk cache of text hash -> float16 embedding bytes.
+    
+    Keys include the embedding model, so switching models never serves
+    vectors from the old one. Methods are blocking; call them through
+    asyncio.to_thread from async code.
+    """
+    
+    def __init__(self, path: str, model: str):
+        """
+        Open (or create) the cache database.
+        
+        Args:
+            path: SQLite database file path
+            model: Embedding model name, mixed into every key
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        
+        self._model = model.encode()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        
+        # WAL lets readers proceed while a write is in progress
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        
+        logger.info("Embedding cache opened at %s", path)
+    
+    def key(self, text: str) -> bytes:
+        """Return the cache key for a text."""
+        return hashlib.sha256(self._model + b"\0" + text.encode()).digest()
+    
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, List[float]]:
+        """
+        Look up cached embeddings.
+        
+        Args:
+            keys: Cache keys from key()
+            
+        Returns:
+            Mapping of found keys to float32-precision embedding lists
+        """
+        found: Dict[bytes, List[float]] = {}
+        
+        with self._lock:
+            for i in range(0, len(keys), _MAX_SQL_PARAMS):
+                batch = keys[i:i + _MAX_SQL_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float16).astype(np.float32).tolist()
+        
+        return found
+    
+    def put_many(self, keys: Sequence[bytes], embeddings: Sequence[Sequence[float]]):
+        """
+        Store embeddings as float16.
+        
+        Args:
+            keys: Cache keys from key()
+            embeddings: Embedding vectors, aligned with keys
+        """
+        if not keys:
+            return
+        
+        vectors = np.asarray(embeddings, dtype=np.float16)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, vector.tobytes()) for key, vector in zip(keys, vectors)]
+            )
+            self._conn.commit()
+    
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
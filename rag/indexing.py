@@ -4,40 +4,56 @@ Handles document processing, chunking, embedding generation, and storage.
 """
 
 import asyncio
+from contextvars import ContextVar
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 import hashlib
+import json
+import uuid
 
-from openai import AsyncOpenAI
-from qdrant_client import QdrantClient
 from qdrant_client.models import (
-    Distance, 
     PointStruct, 
-    VectorParams,
     models
 )
-from pymongo import MongoClient
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient, UpdateOne
 
 from config.settings import settings
 from config.constants import (
     VECTOR_DIMENSION,
+    DOCUMENT_PAYLOAD_INDEXES,
     DOCUMENTS_COLLECTION,
     METADATA_COLLECTION,
     EMBEDDING_TIMEOUT,
-    MAX_CONTENT_LENGTH
+    MAX_CONTENT_LENGTH,
+    EMBED_BATCH_MAX_CHARS,
+    METADATA_FLUSH_SIZE,
+    UPSERT_BATCH_SIZE
 )
 from config.logging_config import get_logger
+from rag.clients import get_openai, get_qdrant, get_mongo
+from rag.embedding_cache import EmbeddingCache
+from rag.schema import create_documents_collection, create_payload_indexes
 from rag.utils import (
-    chunk_text, 
+    chunk_text_soa,
     generate_document_id, 
+    generate_chunk_id,
     generate_uuid,
     clean_text,
-    get_timestamp
+    get_timestamp,
+    normalize_embeddings
 )
 
 logger = get_logger(__name__)
 
+# Namespace for deterministic (UUID5) Qdrant point IDs
+_POINT_ID_NAMESPACE = uuid.UUID("00000000-0000-0000-0000-000000000001")
+
+# Pending metadata upserts for the batch running in the current context;
+# None means metadata is written immediately
+_metadata_batch: ContextVar[Optional[List[UpdateOne]]] = ContextVar(
+    "_metadata_batch", default=None
+)
+
 
 class RAGIndexer:
     """
@@ -48,54 +64,56 @@ class RAGIndexer:
     def __init__(self):
         """Initialize the RAG Indexer with necessary clients."""
         self._initialize_clients()
-        self._initialize_collections()
+        
+        # Caps documents indexed concurrently within a batch
+        self._doc_sem = asyncio.Semaphore(settings.max_concurrent_docs)
+        
+        # Caps in-flight embedding requests across all documents
+        self._embed_sem = asyncio.Semaphore(settings.embed_concurrency)
+        
+        # Optional on-disk cache of chunk embeddings
+        self._embedding_cache: Optional[EmbeddingCache] = None
+        if settings.embedding_cache_enabled:
+            self._embedding_cache = EmbeddingCache(
+                settings.embedding_cache_path,
+                settings.embedding_model
+            )
     
     def _initialize_clients(self):
         """Initialize API clients for Qdrant, MongoDB, and OpenAI."""
         logger.info("Initializing RAG Indexer clients...")
         
-        # Qdrant client for vector storage
-        self.qdrant_client = QdrantClient(
-            url=settings.qdrant_url,
-            api_key=settings.qdrant_api_key,
-            timeout=30
-        )
-        
-        # MongoDB async client for metadata
-        self.mongo_client = AsyncIOMotorClient(settings.mongo_uri)
+        # Shared process-wide clients; see rag.clients
+        self.qdrant_client = get_qdrant()
+        self.mongo_client = get_mongo()
         self.mongo_db = self.mongo_client[settings.mongo_db_name]
-        
-        # OpenAI client (configured for OpenRouter)
-        self.openai_client = AsyncOpenAI(
-            api_key=settings.openrouter_api_key,
-            base_url=settings.openrouter_base_url,
-            timeout=EMBEDDING_TIMEOUT
-        )
+        self.openai_client = get_openai()
         
         logger.info("All clients initialized successfully")
     
-    def _initialize_collections(self):
+    async def initialize(self):
+        """Prepare backing storage. Must be awaited once before indexing."""
+        await self._initialize_collections()
+    
+    async def _initialize_collections(self):
         """Initialize Qdrant collection if it doesn't exist."""
         try:
             # Check if collection exists
-            collections = self.qdrant_client.get_collections()
+            collections = await self.qdrant_client.get_collections()
             collection_names = [c.name for c in collections.collections]
             
             if settings.qdrant_collection not in collection_names:
-                logger.info(f"Creating Qdrant collection: {settings.qdrant_collection}")
-                self.qdrant_client.create_collection(
-                    collection_name=settings.qdrant_collection,
-                    vectors_config=VectorParams(
-                        size=VECTOR_DIMENSION,
-                        distance=Distance.COSINE
-                    )
-                )
-                logger.info(f"Collection {settings.qdrant_collection} created successfully")
+                await create_documents_collection(self.qdrant_client)
+                logger.info("Collection %s created successfully", settings.qdrant_collection)
             else:
-                logger.info(f"Collection {settings.qdrant_collection} already exists")
+                logger.info("Collection %s already exists", settings.qdrant_collection)
+                # Adds indexes introduced since the collection was created
+                await create_payload_indexes(
+                    self.qdrant_client, settings.qdrant_collection, DOCUMENT_PAYLOAD_INDEXES
+                )
                 
         except Exception as e:
-            logger.error(f"Error initializing Qdrant collection: {e}")
+            logger.error("Error initializing Qdrant collection: %s", e)
             raise
     
     async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
@@ -111,25 +129,97 @@ class RAGIndexer:
         if not texts:
             return []
         
-        try:
-            logger.debug(f"Generating embeddings for {len(texts)} texts")
+        cache = self._embedding_cache
+        if cache is None:
+            return await self._request_embeddings(texts)
+        
+        keys = [cache.key(text) for text in texts]
+        cached = await asyncio.to_thread(cache.get_many, keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        
+        if missing:
+            fresh = await self._request_embeddings([texts[i] for i in missing])
+            await asyncio.to_thread(cache.put_many, [keys[i] for i in missing], fresh)
+            for i, vector in zip(missing, fresh):
+                cached[keys[i]] = vector
+        
+        logger.debug("Embedding cache served %s of %s texts", len(texts) - len(missing), len(texts))
+        return [cached[key] for key in keys]
+    
+    async def _request_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Request embeddings from the API in concurrent, size-capped batches.
+        
+        Args:
+            texts: List of text strings to embed
             
-            # OpenRouter embedding request
-            response = await self.openai_client.embeddings.create(
-                model=settings.embedding_model,
-                input=texts
+        Returns:
+            List of embedding vectors
+        """
+        try:
+            batches = self._plan_embedding_batches(texts)
+            logger.debug(
+                "Generating embeddings for %s texts in %s batches",
+                len(texts), len(batches)
             )
             
-            # Extract embeddings from response
-            embeddings = [item.embedding for item in response.data]
+            async def embed_batch(batch: List[int]):
+                async with self._embed_sem:
+                    # OpenRouter embedding request
+                    response = await self.openai_client.embeddings.create(
+                        model=settings.embedding_model,
+                        input=[texts[i] for i in batch],
+                        timeout=EMBEDDING_TIMEOUT
+                    )
+                return batch, [item.embedding for item in response.data]
+            
+            # Scatter each batch's embeddings back to their original positions
+            embeddings: List[List[float]] = [None] * len(texts)
+            for batch, vectors in await asyncio.gather(*[embed_batch(b) for b in batches]):
+                for i, vector in zip(batch, vectors):
+                    embeddings[i] = vector
             
-            logger.debug(f"Successfully generated {len(embeddings)} embeddings")
+            logger.debug("Successfully generated %s embeddings", len(embeddings))
             return embeddings
             
         except Exception as e:
-            logger.error(f"Error generating embeddings: {e}")
+            logger.error("Error generating embeddings: %s", e)
             raise
     
+    def _plan_embedding_batches(self, texts: List[str]) -> List[List[int]]:
+        """
+        Group text indices into embedding request batches.
+        
+        Texts are sorted by length so similar-sized inputs share a request,
+        and each batch is capped by count and total characters.
+        
+        Args:
+            texts: List of text strings to embed
+            
+        Returns:
+            List of batches, each a list of indices into texts
+        """
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        
+        batches = []
+        current: List[int] = []
+        current_chars = 0
+        for i in order:
+            size = len(texts[i])
+            if current and (
+                len(current) >= settings.embed_batch_size
+                or current_chars + size > EMBED_BATCH_MAX_CHARS
+            ):
+                batches.append(current)
+                current = []
+                current_chars = 0
+            current.append(i)
+            current_chars += size
+        
+        if current:
+            batches.append(current)
+        return batches
+    
     async def index_document(self, document: Dict[str, Any]) -> Dict[str, Any]:
         """
         Index a single document.
@@ -148,9 +238,9 @@ class RAGIndexer:
             source = document.get("source", "unknown")
             content = document.get("content", "")
             url = document.get("url", "")
-            metadata = document.get("metadata", {})
+            metadata = document.get("metadata") or {}
             
-            logger.info(f"Indexing document: {source}")
+            logger.info("Indexing document: %s", source)
             
             # Validate content
             if not content or not content.strip():
@@ -162,60 +252,101 @@ class RAGIndexer:
             
             # Truncate if too long
             if len(content) > MAX_CONTENT_LENGTH:
-                logger.warning(f"Document {source} truncated from {len(content)} to {MAX_CONTENT_LENGTH} chars")
+                logger.warning(
+                    "Document %s truncated from %s to %s chars",
+                    source, len(content), MAX_CONTENT_LENGTH
+                )
                 content = content[:MAX_CONTENT_LENGTH]
             
             # Generate document ID
             document_id = generate_document_id(source, content)
             
             # Chunk the document
-            chunks = chunk_text(
+            # Chunk texts plus a column of (start_char, end_char, chunk_index) rows
+            chunk_texts, chunk_offsets = chunk_text_soa(
                 text=content,
                 chunk_size=settings.chunk_size,
-                overlap=settings.chunk_overlap
+                overlap=settings.chunk_overlap,
+                use_cdc=settings.chunking_use_cdc
             )
             
-            if not chunks:
+            if not chunk_texts:
                 return {
                     "status": "error",
                     "message": "No chunks generated",
                     "source": source
                 }
             
-            logger.info(f"Generated {len(chunks)} chunks for document: {source}")
+            logger.info("Generated %s chunks for document: %s", len(chunk_texts), source)
+            
+            # Deterministic point IDs make re-indexing idempotent
+            point_ids = [
+                str(uuid.uuid5(_POINT_ID_NAMESPACE, generate_chunk_id(document_id, idx)))
+                for idx in range(len(chunk_texts))
+            ]
+            
+            # Fingerprint each chunk's payload so unchanged chunks can be skipped
+            payload_fingerprint = f"{url}\0{json.dumps(metadata, sort_keys=True, default=str)}"
+            chunk_hashes = [
+                hashlib.blake2b(
+                    f"{text}\0{payload_fingerprint}".encode(),
+                    digest_size=16
+                ).hexdigest()
+                for text in chunk_texts
+            ]
+            
+            existing = await self.qdrant_client.retrieve(
+                collection_name=settings.qdrant_collection,
+                ids=point_ids,
+                with_payload=["chunk_hash"],
+                with_vectors=False
+            )
+            existing_hashes = {
+                str(point.id): (point.payload or {}).get("chunk_hash")
+                for point in existing
+            }
+            pending = [
+                idx for idx in range(len(chunk_texts))
+                if existing_hashes.get(point_ids[idx]) != chunk_hashes[idx]
+            ]
             
-            # Generate embeddings for all chunks
-            chunk_texts = [chunk["text"] for chunk in chunks]
-            embeddings = await self.generate_embeddings(chunk_texts)
+            # Generate embeddings only for new or changed chunks
+            embeddings = await self.generate_embeddings([chunk_texts[idx] for idx in pending])
+            
+            # Unit-length float32 vectors let cosine search reduce to a dot product
+            vectors = normalize_embeddings(embeddings).tolist() if embeddings else []
             
             # Prepare points for Qdrant
+            offsets = chunk_offsets.tolist()
             points = []
-            for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                point_id = abs(hash(f"{document_id}_{idx}")) % (2**63)  # Ensure positive int
-                
+            for idx, vector in zip(pending, vectors):
                 points.append(PointStruct(
-                    id=point_id,
-                    vector=embedding,
+                    id=point_ids[idx],
+                    vector=vector,
                     payload={
                         "document_id": document_id,
                         "source": source,
                         "url": url,
                         "chunk_index": idx,
-                        "text": chunk["text"],
-                        "start_char": chunk["start_char"],
-                        "end_char": chunk["end_char"],
+                        "text": chunk_texts[idx],
+                        "start_char": offsets[idx][0],
+                        "end_char": offsets[idx][1],
                         "metadata": metadata,
+                        "chunk_hash": chunk_hashes[idx],
                         "indexed_at": get_timestamp()
                     }
                 ))
             
             # Upsert to Qdrant
-            self.qdrant_client.upsert(
-                collection_name=settings.qdrant_collection,
-                points=points
-            )
+            if points:
+                await self._upsert_points(points)
+            
+            # A shorter re-index leaves points past the new last chunk behind
+            await self._delete_stale_chunks(document_id, len(chunk_texts))
             
-            logger.info(f"Successfully indexed {len(points)} chunks to Qdrant")
+            if len(points) < len(chunk_texts):
+                logger.info("Skipped %s unchanged chunks", len(chunk_texts) - len(points))
+            logger.info("Successfully indexed %s chunks to Qdrant", len(points))
             
             # Store document metadata in MongoDB
             await self._store_document_metadata(
@@ -223,7 +354,7 @@ class RAGIndexer:
                 source=source,
                 url=url,
                 content_length=len(content),
-                chunk_count=len(chunks),
+                chunk_count=len(chunk_texts),
                 metadata=metadata
             )
             
@@ -231,18 +362,70 @@ class RAGIndexer:
                 "status": "success",
                 "document_id": document_id,
                 "source": source,
-                "chunks_indexed": len(chunks),
-                "message": f"Successfully indexed {len(chunks)} chunks"
+                "chunks_indexed": len(chunk_texts),
+                "message": f"Successfully indexed {len(chunk_texts)} chunks"
             }
             
         except Exception as e:
-            logger.error(f"Error indexing document {document.get('source', 'unknown')}: {e}")
+            logger.error("Error indexing document %s: %s", document.get("source", "unknown"), e)
             return {
                 "status": "error",
                 "source": document.get("source", "unknown"),
                 "message": str(e)
             }
     
+    async def _delete_stale_chunks(self, document_id: str, chunk_count: int):
+        """
+        Delete a document's points whose chunk_index is no longer produced.
+        
+        Args:
+            document_id: ID of the re-indexed document
+            chunk_count: Number of chunks in the current version
+        """
+        await self.qdrant_client.delete(
+            collection_name=settings.qdrant_collection,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="document_id",
+                            match=models.MatchValue(value=document_id)
+                        ),
+                        models.FieldCondition(
+                            key="chunk_index",
+                            range=models.Range(gte=chunk_count)
+                        )
+                    ]
+                )
+            )
+        )
+    
+    async def _upsert_points(self, points: List[PointStruct]):
+        """
+        Upsert points in sub-batches without waiting for each to be applied.
+        
+        The final batch is sent with wait=True once the others are acknowledged;
+        Qdrant applies updates in order, so its completion covers every batch.
+        """
+        batches = [
+            points[i:i + UPSERT_BATCH_SIZE]
+            for i in range(0, len(points), UPSERT_BATCH_SIZE)
+        ]
+        
+        await asyncio.gather(*[
+            self.qdrant_client.upsert(
+                collection_name=settings.qdrant_collection,
+                points=batch,
+                wait=False
+            )
+            for batch in batches[:-1]
+        ])
+        await self.qdrant_client.upsert(
+            collection_name=settings.qdrant_collection,
+            points=batches[-1],
+            wait=True
+        )
+    
     async def index_documents(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Index multiple documents.
@@ -253,7 +436,7 @@ class RAGIndexer:
         Returns:
             Summary of indexing results
         """
-        logger.info(f"Starting batch indexing of {len(documents)} documents")
+        logger.info("Starting batch indexing of %s documents", len(documents))
         
         results = {
             "total": len(documents),
@@ -263,8 +446,25 @@ class RAGIndexer:
             "details": []
         }
         
-        for doc in documents:
-            result = await self.index_document(doc)
+        # Index documents concurrently, bounded by the semaphore; metadata
+        # writes are buffered and flushed with unordered bulk writes
+        batch_token = _metadata_batch.set([])
+        try:
+            gathered = await asyncio.gather(
+                *[self._guarded_index(doc) for doc in documents],
+                return_exceptions=True
+            )
+            await self._flush_document_metadata()
+        finally:
+            _metadata_batch.reset(batch_token)
+        
+        for doc, result in zip(documents, gathered):
+            if isinstance(result, BaseException):
+                result = {
+                    "status": "error",
+                    "source": doc.get("source", "unknown"),
+                    "message": str(result)
+                }
             results["details"].append(result)
             
             if result["status"] == "success":
@@ -274,12 +474,17 @@ class RAGIndexer:
                 results["failed"] += 1
         
         logger.info(
-            f"Batch indexing complete: {results['successful']}/{results['total']} successful, "
-            f"{results['total_chunks']} total chunks"
+            "Batch indexing complete: %s/%s successful, %s total chunks",
+            results["successful"], results["total"], results["total_chunks"]
         )
         
         return results
     
+    async def _guarded_index(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Index a document while holding a concurrency slot."""
+        async with self._doc_sem:
+            return await self.index_document(document)
+    
     async def _store_document_metadata(
         self,
         document_id: str,
@@ -302,6 +507,18 @@ class RAGIndexer:
                 "updated_at": datetime.utcnow()
             }
             
+            # Buffer the upsert when inside a batch
+            buffer = _metadata_batch.get()
+            if buffer is not None:
+                buffer.append(UpdateOne(
+                    {"document_id": document_id},
+                    {"$set": doc_metadata},
+                    upsert=True
+                ))
+                if len(buffer) >= METADATA_FLUSH_SIZE:
+                    await self._flush_document_metadata()
+                return
+            
             # Upsert document metadata
             await self.mongo_db[DOCUMENTS_COLLECTION].update_one(
                 {"document_id": document_id},
@@ -309,10 +526,26 @@ class RAGIndexer:
                 upsert=True
             )
             
-            logger.debug(f"Stored metadata for document: {source}")
+            logger.debug("Stored metadata for document: %s", source)
+            
+        except Exception as e:
+            logger.error("Error storing document metadata: %s", e)
+            # Don't raise - metadata storage failure shouldn't block indexing
+    
+    async def _flush_document_metadata(self):
+        """Write buffered metadata upserts in a single unordered bulk write."""
+        buffer = _metadata_batch.get()
+        if not buffer:
+            return
+        
+        operations = buffer[:]
+        buffer.clear()
+        try:
+            await self.mongo_db[DOCUMENTS_COLLECTION].bulk_write(operations, ordered=False)
+            logger.debug("Stored metadata for %s documents", len(operations))
             
         except Exception as e:
-            logger.error(f"Error storing document metadata: {e}")
+            logger.error("Error storing document metadata: %s", e)
             # Don't raise - metadata storage failure shouldn't block indexing
     
     async def delete_document(self, document_id: str) -> Dict[str, Any]:
@@ -326,10 +559,10 @@ class RAGIndexer:
             Deletion result
         """
         try:
-            logger.info(f"Deleting document: {document_id}")
+            logger.info("Deleting document: %s", document_id)
             
             # Delete from Qdrant
-            self.qdrant_client.delete(
+            await self.qdrant_client.delete(
                 collection_name=settings.qdrant_collection,
                 points_selector=models.FilterSelector(
                     filter=models.Filter(
@@ -348,18 +581,18 @@ class RAGIndexer:
                 {"document_id": document_id}
             )
             
-            logger.info(f"Successfully deleted document: {document_id}")
+            logger.info("Successfully deleted document: %s", document_id)
             return {"status": "success", "document_id": document_id}
             
         except Exception as e:
-            logger.error(f"Error deleting document {document_id}: {e}")
+            logger.error("Error deleting document %s: %s", document_id, e)
             return {"status": "error", "message": str(e)}
     
     async def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the indexed collection."""
         try:
             # Qdrant collection info
-            collection_info = self.qdrant_client.get_collection(settings.qdrant_collection)
+            collection_info = await self.qdrant_client.get_collection(settings.qdrant_collection)
             
             # MongoDB document count
             doc_count = await self.mongo_db[DOCUMENTS_COLLECTION].count_documents({})
@@ -373,14 +606,11 @@ class RAGIndexer:
             }
             
         except Exception as e:
-            logger.error(f"Error getting collection stats: {e}")
+            logger.error("Error getting collection stats: %s", e)
             return {"status": "error", "message": str(e)}
     
-    def close(self):
-        """Close all client connections."""
-        try:
-            self.qdrant_client.close()
-            self.mongo_client.close()
-            logger.info("All connections closed")
-        except Exception as e:
-            logger.error(f"Error closing connections: {e}")
+    async def close(self):
+        """Release indexer resources. Shared clients are closed by close_clients."""
+        if self._embedding_cache is not None:
+            self._embedding_cache.close()
+        logger.info("Indexer closed")
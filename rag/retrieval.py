@@ -4,17 +4,28 @@ Handles query processing, semantic search, and response generation.
 """
 
 import asyncio
-from typing import List, Dict, Any, Optional, Tuple
+import hashlib
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, Union
 from datetime import datetime
 
-from openai import AsyncOpenAI
-from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchValue
-from motor.motor_asyncio import AsyncIOMotorClient
+import numpy as np
+
+from qdrant_client.models import (
+    Filter,
+    FieldCondition,
+    MatchValue,
+    PointStruct,
+    Range,
+    models
+)
 
 from config.settings import settings
 from config.constants import (
-    VECTOR_DIMENSION,
+    QUANTIZATION_OVERSAMPLING,
     MAX_SOURCES_RETURNED,
     MIN_SIMILARITY_SCORE,
     DEFAULT_NO_ANSWER,
@@ -22,13 +33,33 @@ from config.constants import (
     RAG_PROMPT_TEMPLATE,
     LLM_TIMEOUT,
     EMBEDDING_TIMEOUT,
-    CHAT_HISTORY_COLLECTION
+    CHAT_HISTORY_COLLECTION,
+    CHAT_HISTORY_INDEX,
+    CHAT_HISTORY_INDEX_KEYS,
+    QUERY_CACHE_COLLECTION,
+    RETRIEVAL_PAYLOAD_FIELDS
 )
 from config.logging_config import get_logger
-from rag.utils import truncate_text, get_timestamp
+from rag.clients import get_openai, get_qdrant, get_mongo
+from rag.schema import create_query_cache_collection
+from rag.utils import truncate_text, get_timestamp, normalize_embeddings
 
 logger = get_logger(__name__)
 
+# Fetch only the payload fields retrieval reads, skipping e.g. chunk_hash
+_RETRIEVAL_PAYLOAD = models.PayloadSelectorInclude(include=RETRIEVAL_PAYLOAD_FIELDS)
+
+# Separator between retrieved chunks in the LLM context
+_CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+# Search the INT8 index, then rescore the oversampled top hits in full precision
+_QUANTIZED_SEARCH_PARAMS = models.SearchParams(
+    quantization=models.QuantizationSearchParams(
+        rescore=True,
+        oversampling=QUANTIZATION_OVERSAMPLING
+    )
+)
+
 
 class RAGRetriever:
     """
@@ -39,30 +70,139 @@ class RAGRetriever:
     def __init__(self):
         """Initialize the RAG Retriever with necessary clients."""
         self._initialize_clients()
+        
+        # LRU of query hash -> float32 embedding bytes
+        self._query_emb_cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._query_emb_lock = asyncio.Lock()
+        
+        # Fire-and-forget writes kept referenced until they finish
+        self._bg_tasks: set = set()
     
     def _initialize_clients(self):
         """Initialize API clients."""
         logger.info("Initializing RAG Retriever clients...")
         
-        # Qdrant client for vector search
-        self.qdrant_client = QdrantClient(
-            url=settings.qdrant_url,
-            api_key=settings.qdrant_api_key,
-            timeout=30
-        )
-        
-        # MongoDB async client for chat history
-        self.mongo_client = AsyncIOMotorClient(settings.mongo_uri)
+        # Shared process-wide clients; see rag.clients
+        self.qdrant_client = get_qdrant()
+        self.mongo_client = get_mongo()
         self.mongo_db = self.mongo_client[settings.mongo_db_name]
+        self.openai_client = get_openai()
         
-        # OpenAI client (configured for OpenRouter)
-        self.openai_client = AsyncOpenAI(
-            api_key=settings.openrouter_api_key,
-            base_url=settings.openrouter_base_url,
-            timeout=LLM_TIMEOUT
+        logger.info("Retriever clients initialized successfully")
+    
+    async def initialize(self):
+        """Prepare backing storage. Must be awaited once before querying."""
+        await self._initialize_history_index()
+        
+        if settings.semantic_cache_enabled:
+            await self._initialize_cache_collection()
+    
+    async def _initialize_history_index(self):
+        """Ensure the compound index used by get_chat_history exists."""
+        try:
+            await self.mongo_db[CHAT_HISTORY_COLLECTION].create_index(
+                CHAT_HISTORY_INDEX_KEYS,
+                name=CHAT_HISTORY_INDEX
+            )
+            
+        except Exception as e:
+            logger.error("Error creating chat history index: %s", e)
+            raise
+    
+    async def _initialize_cache_collection(self):
+        """Create the semantic response cache collection and drop expired entries."""
+        try:
+            collections = await self.qdrant_client.get_collections()
+            collection_names = [c.name for c in collections.collections]
+            
+            if QUERY_CACHE_COLLECTION not in collection_names:
+                await create_query_cache_collection(self.qdrant_client)
+            else:
+                await self.prune_query_cache()
+                
+        except Exception as e:
+            logger.error("Error initializing query cache collection: %s", e)
+            raise
+    
+    async def prune_query_cache(self):
+        """Delete cached responses older than the configured TTL."""
+        cutoff = time.time() - settings.semantic_cache_ttl_seconds
+        await self.qdrant_client.delete(
+            collection_name=QUERY_CACHE_COLLECTION,
+            points_selector=models.FilterSelector(
+                filter=Filter(
+                    must=[FieldCondition(key="ts", range=Range(lt=cutoff))]
+                )
+            )
         )
+    
+    async def _lookup_cached_response(
+        self,
+        query_embedding: List[float],
+        filter_source: Optional[str]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached response for a semantically similar earlier query.
         
-        logger.info("Retriever clients initialized successfully")
+        Args:
+            query_embedding: Embedding of the current query
+            filter_source: Source filter the answer must have been produced with
+            
+        Returns:
+            Cached payload, or None on a miss
+        """
+        try:
+            response = await self.qdrant_client.query_points(
+                collection_name=QUERY_CACHE_COLLECTION,
+                query=query_embedding,
+                limit=1,
+                score_threshold=settings.semantic_cache_threshold,
+                query_filter=Filter(
+                    must=[
+                        FieldCondition(
+                            key="filter_source",
+                            match=MatchValue(value=filter_source or "")
+                        ),
+                        FieldCondition(
+                            key="ts",
+                            range=Range(gte=time.time() - settings.semantic_cache_ttl_seconds)
+                        )
+                    ]
+                )
+            )
+            hits = response.points
+            return hits[0].payload if hits else None
+            
+        except Exception as e:
+            logger.error("Error reading query cache: %s", e)
+            return None
+    
+    async def _store_cached_response(
+        self,
+        query_embedding: List[float],
+        filter_source: Optional[str],
+        result: Dict[str, Any]
+    ):
+        """Store a generated response in the semantic response cache."""
+        try:
+            await self.qdrant_client.upsert(
+                collection_name=QUERY_CACHE_COLLECTION,
+                points=[PointStruct(
+                    id=str(uuid.uuid4()),
+                    vector=query_embedding,
+                    payload={
+                        "answer": result["answer"],
+                        "sources": result["sources"],
+                        "documents_retrieved": result["documents_retrieved"],
+                        "filter_source": filter_source or "",
+                        "ts": time.time()
+                    }
+                )]
+            )
+            
+        except Exception as e:
+            logger.error("Error writing query cache: %s", e)
+            # Don't raise - cache failures shouldn't break the response
     
     async def generate_query_embedding(self, query: str) -> List[float]:
         """
@@ -74,23 +214,42 @@ class RAGRetriever:
         Returns:
             Embedding vector
         """
+        cache_key = hashlib.sha256(query.strip().lower().encode()).hexdigest()
+        
+        async with self._query_emb_lock:
+            cached = self._query_emb_cache.get(cache_key)
+            if cached is not None:
+                self._query_emb_cache.move_to_end(cache_key)
+        if cached is not None:
+            return np.frombuffer(cached, dtype=np.float32).tolist()
+        
         try:
             response = await self.openai_client.embeddings.create(
                 model=settings.embedding_model,
                 input=query
             )
-            return response.data[0].embedding
+            embedding = normalize_embeddings(response.data[0].embedding)[0]
             
         except Exception as e:
-            logger.error(f"Error generating query embedding: {e}")
+            logger.error("Error generating query embedding: %s", e)
             raise
+        
+        if settings.query_emb_cache_size > 0:
+            async with self._query_emb_lock:
+                self._query_emb_cache[cache_key] = embedding.tobytes()
+                self._query_emb_cache.move_to_end(cache_key)
+                while len(self._query_emb_cache) > settings.query_emb_cache_size:
+                    self._query_emb_cache.popitem(last=False)
+        
+        return embedding.tolist()
     
     async def retrieve_relevant_documents(
         self, 
         query: str,
         top_k: Optional[int] = None,
         score_threshold: Optional[float] = None,
-        filter_source: Optional[str] = None
+        filter_source: Optional[str] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
         """
         Retrieve relevant documents for a query using semantic search.
@@ -100,6 +259,7 @@ class RAGRetriever:
             top_k: Number of documents to retrieve (default from settings)
             score_threshold: Minimum similarity score (default from settings)
             filter_source: Optional filter by source name
+            query_embedding: Precomputed query embedding, if already available
             
         Returns:
             List of relevant document chunks with metadata
@@ -108,10 +268,12 @@ class RAGRetriever:
         score_threshold = score_threshold or settings.similarity_threshold
         
         try:
-            logger.info(f"Retrieving documents for query: {query[:50]}...")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Retrieving documents for query: %s...", query[:50])
             
             # Generate query embedding
-            query_embedding = await self.generate_query_embedding(query)
+            if query_embedding is None:
+                query_embedding = await self.generate_query_embedding(query)
             
             # Build filter if source is specified
             search_filter = None
@@ -126,17 +288,19 @@ class RAGRetriever:
                 )
             
             # Search in Qdrant
-            search_results = self.qdrant_client.search(
+            response = await self.qdrant_client.query_points(
                 collection_name=settings.qdrant_collection,
-                query_vector=query_embedding,
+                query=query_embedding,
                 limit=top_k,
                 score_threshold=score_threshold,
-                query_filter=search_filter
+                query_filter=search_filter,
+                search_params=_QUANTIZED_SEARCH_PARAMS,
+                with_payload=_RETRIEVAL_PAYLOAD
             )
             
             # Format results
             documents = []
-            for result in search_results:
+            for result in response.points:
                 documents.append({
                     "text": result.payload.get("text", ""),
                     "source": result.payload.get("source", "unknown"),
@@ -147,11 +311,11 @@ class RAGRetriever:
                     "metadata": result.payload.get("metadata", {})
                 })
             
-            logger.info(f"Retrieved {len(documents)} relevant documents")
+            logger.info("Retrieved %s relevant documents", len(documents))
             return documents
             
         except Exception as e:
-            logger.error(f"Error retrieving documents: {e}")
+            logger.error("Error retrieving documents: %s", e)
             raise
     
     async def generate_response(
@@ -172,24 +336,13 @@ class RAGRetriever:
             Generated response text
         """
         try:
-            # Use default or custom system prompt
-            sys_prompt = system_prompt or SYSTEM_PROMPT
-            
-            # Format user prompt with context
-            user_prompt = RAG_PROMPT_TEMPLATE.format(
-                context=context,
-                question=query
-            )
-            
-            logger.debug(f"Generating response for query: {query[:50]}...")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Generating response for query: %s...", query[:50])
             
             # Call LLM via OpenRouter
             response = await self.openai_client.chat.completions.create(
                 model=settings.llm_model,
-                messages=[
-                    {"role": "system", "content": sys_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=self._build_messages(query, context, system_prompt),
                 temperature=settings.temperature,
                 max_tokens=settings.max_tokens
             )
@@ -200,16 +353,99 @@ class RAGRetriever:
             return answer
             
         except Exception as e:
-            logger.error(f"Error generating LLM response: {e}")
+            logger.error("Error generating LLM response: %s", e)
+            raise
+    
+    async def stream_response(
+        self,
+        query: str,
+        context: str,
+        system_prompt: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the LLM response token deltas as they are generated.
+        
+        Args:
+            query: User's question
+            context: Retrieved document context
+            system_prompt: Optional custom system prompt
+            
+        Yields:
+            Response text deltas
+        """
+        try:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Streaming response for query: %s...", query[:50])
+            
+            response = await self.openai_client.chat.completions.create(
+                model=settings.llm_model,
+                messages=self._build_messages(query, context, system_prompt),
+                temperature=settings.temperature,
+                max_tokens=settings.max_tokens,
+                stream=True
+            )
+            
+            async for chunk in response:
+                if chunk.choices:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+            
+        except Exception as e:
+            logger.error("Error streaming LLM response: %s", e)
             raise
     
+    def _build_messages(
+        self,
+        query: str,
+        context: str,
+        system_prompt: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        """Build the chat messages for a query and its retrieved context."""
+        # Format user prompt with context
+        user_prompt = RAG_PROMPT_TEMPLATE.format(
+            context=context,
+            question=query
+        )
+        
+        return [
+            {"role": "system", "content": system_prompt or SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def _build_context(self, retrieved_docs: List[Dict[str, Any]]) -> str:
+        """Join retrieved chunks into the LLM context block."""
+        # Lay out every fragment in one list so the context is built by a single join
+        parts = [None] * (4 * len(retrieved_docs))
+        for i, doc in enumerate(retrieved_docs):
+            parts[4 * i] = _CONTEXT_SEPARATOR + "[Source: " if i else "[Source: "
+            parts[4 * i + 1] = doc.get("source", "Document")
+            parts[4 * i + 2] = "]\n"
+            parts[4 * i + 3] = doc.get("text", "")
+        
+        return "".join(parts)
+    
+    def _format_sources(self, retrieved_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Format the top retrieved chunks as response sources."""
+        return [
+            {
+                "source": doc["source"],
+                "url": doc["url"],
+                "text": truncate_text(doc["text"], 200),
+                "score": doc["score"],
+                "chunk_index": doc["chunk_index"]
+            }
+            for doc in retrieved_docs[:MAX_SOURCES_RETURNED]
+        ]
+    
     async def query(
         self, 
         user_query: str,
         session_id: Optional[str] = None,
         top_k: Optional[int] = None,
-        filter_source: Optional[str] = None
-    ) -> Dict[str, Any]:
+        filter_source: Optional[str] = None,
+        stream: bool = False
+    ) -> Union[Dict[str, Any], AsyncIterator[Dict[str, Any]]]:
         """
         Complete RAG query pipeline: retrieve → generate → return.
         
@@ -218,22 +454,45 @@ class RAGRetriever:
             session_id: Optional session ID for chat history
             top_k: Number of documents to retrieve
             filter_source: Optional filter by source
+            stream: Return an async iterator of events instead of a dict
             
         Returns:
-            Response dictionary with answer and sources
+            Response dictionary with answer and sources, or an async
+            iterator of "sources", "token" and "done" events when streaming
         """
-        start_time = datetime.utcnow()
+        if stream:
+            return self._stream_query(user_query, session_id, top_k, filter_source)
+        
+        start_ns = time.perf_counter_ns()
         
         try:
-            logger.info(f"Processing query: {user_query[:100]}...")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Processing query: %s...", user_query[:100])
+            
+            # Embed once; reused by the response cache and retrieval
+            query_embedding = await self.generate_query_embedding(user_query)
             
-            # Step 1: Retrieve relevant documents
-            retrieved_docs = await self.retrieve_relevant_documents(
-                query=user_query,
-                top_k=top_k,
-                filter_source=filter_source
+            # Step 1: Retrieve relevant documents, racing the response cache
+            cached, retrieved_docs = await self._lookup_and_retrieve(
+                user_query, query_embedding, top_k, filter_source
             )
             
+            # Serve near-duplicate questions from the response cache
+            if cached is not None:
+                result = {
+                    "answer": cached["answer"],
+                    "sources": cached["sources"],
+                    "query": user_query,
+                    "documents_retrieved": cached.get("documents_retrieved", 0),
+                    "processing_time_ms": self._calculate_time(start_ns),
+                    "status": "cache_hit"
+                }
+                
+                if session_id:
+                    self._schedule_chat_history(session_id, user_query, result)
+                
+                return result
+            
             # Handle no results
             if not retrieved_docs:
                 logger.warning("No relevant documents found for query")
@@ -241,39 +500,24 @@ class RAGRetriever:
                     "answer": DEFAULT_NO_ANSWER,
                     "sources": [],
                     "query": user_query,
-                    "processing_time_ms": self._calculate_time(start_time),
+                    "processing_time_ms": self._calculate_time(start_ns),
                     "status": "no_results"
                 }
                 
                 # Store in history
                 if session_id:
-                    await self._store_chat_history(session_id, user_query, result)
+                    self._schedule_chat_history(session_id, user_query, result)
                 
                 return result
             
             # Step 2: Build context from retrieved documents
-            context_parts = []
-            for i, doc in enumerate(retrieved_docs):
-                source_label = doc.get("source", "Document")
-                text = doc.get("text", "")
-                context_parts.append(f"[Source: {source_label}]\n{text}")
-            
-            context = "\n\n---\n\n".join(context_parts)
+            context = self._build_context(retrieved_docs)
             
             # Step 3: Generate response
             answer = await self.generate_response(user_query, context)
             
             # Step 4: Format sources for response
-            sources = [
-                {
-                    "source": doc["source"],
-                    "url": doc["url"],
-                    "text": truncate_text(doc["text"], 200),
-                    "score": doc["score"],
-                    "chunk_index": doc["chunk_index"]
-                }
-                for doc in retrieved_docs[:MAX_SOURCES_RETURNED]
-            ]
+            sources = self._format_sources(retrieved_docs)
             
             # Build response
             result = {
@@ -281,28 +525,170 @@ class RAGRetriever:
                 "sources": sources,
                 "query": user_query,
                 "documents_retrieved": len(retrieved_docs),
-                "processing_time_ms": self._calculate_time(start_time),
+                "processing_time_ms": self._calculate_time(start_ns),
                 "status": "success"
             }
             
+            if settings.semantic_cache_enabled:
+                self._schedule_cached_response(query_embedding, filter_source, result)
+            
             # Store in chat history
             if session_id:
-                await self._store_chat_history(session_id, user_query, result)
+                self._schedule_chat_history(session_id, user_query, result)
             
-            logger.info(f"Query processed successfully in {result['processing_time_ms']}ms")
+            logger.info("Query processed successfully in %sms", result["processing_time_ms"])
             return result
             
         except Exception as e:
-            logger.error(f"Error in query pipeline: {e}")
+            logger.error("Error in query pipeline: %s", e)
             return {
                 "answer": "I encountered an error while processing your question. Please try again.",
                 "sources": [],
                 "query": user_query,
-                "processing_time_ms": self._calculate_time(start_time),
+                "processing_time_ms": self._calculate_time(start_ns),
                 "status": "error",
                 "error": str(e)
             }
     
+    async def _lookup_and_retrieve(
+        self,
+        user_query: str,
+        query_embedding: List[float],
+        top_k: Optional[int],
+        filter_source: Optional[str]
+    ) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Run the response cache lookup and document retrieval concurrently.
+        
+        Both only need the query embedding, so a cache miss no longer pays
+        for the lookup round trip before retrieval starts.
+        
+        Returns:
+            Tuple of (cached payload or None, retrieved documents)
+        """
+        retrieval = self.retrieve_relevant_documents(
+            query=user_query,
+            top_k=top_k,
+            filter_source=filter_source,
+            query_embedding=query_embedding
+        )
+        
+        if not settings.semantic_cache_enabled:
+            return None, await retrieval
+        
+        return await asyncio.gather(
+            self._lookup_cached_response(query_embedding, filter_source),
+            retrieval
+        )
+    
+    async def _stream_query(
+        self,
+        user_query: str,
+        session_id: Optional[str],
+        top_k: Optional[int],
+        filter_source: Optional[str]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of the query pipeline.
+        
+        Yields a "sources" event as soon as retrieval finishes, then one
+        "token" event per LLM delta, then a final "done" event. Failures
+        after the first event are reported as an "error" event.
+        """
+        start_ns = time.perf_counter_ns()
+        
+        try:
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Processing streaming query: %s...", user_query[:100])
+            
+            query_embedding = await self.generate_query_embedding(user_query)
+            
+            cached, retrieved_docs = await self._lookup_and_retrieve(
+                user_query, query_embedding, top_k, filter_source
+            )
+            
+            if cached is not None:
+                answer = cached["answer"]
+                sources = cached["sources"]
+                documents_retrieved = cached.get("documents_retrieved", 0)
+                status = "cache_hit"
+                yield {"type": "sources", "sources": sources, "documents_retrieved": documents_retrieved}
+                yield {"type": "token", "content": answer}
+            else:
+                documents_retrieved = len(retrieved_docs)
+                
+                if not retrieved_docs:
+                    logger.warning("No relevant documents found for query")
+                    answer = DEFAULT_NO_ANSWER
+                    sources = []
+                    status = "no_results"
+                    yield {"type": "sources", "sources": sources, "documents_retrieved": 0}
+                    yield {"type": "token", "content": answer}
+                else:
+                    sources = self._format_sources(retrieved_docs)
+                    status = "success"
+                    yield {"type": "sources", "sources": sources, "documents_retrieved": documents_retrieved}
+                    
+                    parts = []
+                    async for delta in self.stream_response(user_query, self._build_context(retrieved_docs)):
+                        parts.append(delta)
+                        yield {"type": "token", "content": delta}
+                    answer = "".join(parts)
+            
+            result = {
+                "answer": answer,
+                "sources": sources,
+                "query": user_query,
+                "documents_retrieved": documents_retrieved,
+                "processing_time_ms": self._calculate_time(start_ns),
+                "status": status
+            }
+            
+            if status == "success" and settings.semantic_cache_enabled:
+                self._schedule_cached_response(query_embedding, filter_source, result)
+            
+            if session_id:
+                self._schedule_chat_history(session_id, user_query, result)
+            
+            yield {
+                "type": "done",
+                "processing_time_ms": result["processing_time_ms"],
+                "status": status
+            }
+            
+        except Exception as e:
+            logger.error("Error in streaming query pipeline: %s", e)
+            yield {
+                "type": "error",
+                "processing_time_ms": self._calculate_time(start_ns),
+                "status": "error",
+                "error": str(e)
+            }
+    
+    def _schedule_cached_response(
+        self,
+        query_embedding: List[float],
+        filter_source: Optional[str],
+        result: Dict[str, Any]
+    ):
+        """Write the semantic cache entry in the background, off the response path."""
+        task = asyncio.create_task(
+            self._store_cached_response(query_embedding, filter_source, result)
+        )
+        self._bg_tasks.add(task)
+        task.add_done_callback(self._bg_tasks.discard)
+    
+    def _schedule_chat_history(
+        self,
+        session_id: str,
+        query: str,
+        result: Dict[str, Any]
+    ):
+        """Store chat history in the background, off the response path."""
+        task = asyncio.create_task(self._store_chat_history(session_id, query, result))
+        self._bg_tasks.add(task)
+        task.add_done_callback(self._bg_tasks.discard)
+    
     async def _store_chat_history(
         self, 
         session_id: str, 
@@ -322,10 +708,10 @@ class RAGRetriever:
             }
             
             await self.mongo_db[CHAT_HISTORY_COLLECTION].insert_one(chat_entry)
-            logger.debug(f"Stored chat history for session: {session_id}")
+            logger.debug("Stored chat history for session: %s", session_id)
             
         except Exception as e:
-            logger.error(f"Error storing chat history: {e}")
+            logger.error("Error storing chat history: %s", e)
             # Don't raise - history storage failure shouldn't break the response
     
     async def get_chat_history(
@@ -346,7 +732,7 @@ class RAGRetriever:
         try:
             cursor = self.mongo_db[CHAT_HISTORY_COLLECTION].find(
                 {"session_id": session_id}
-            ).sort("timestamp", -1).limit(limit)
+            ).sort("timestamp", -1).limit(limit).hint(CHAT_HISTORY_INDEX)
             
             history = await cursor.to_list(length=limit)
             
@@ -357,7 +743,7 @@ class RAGRetriever:
             return history[::-1]  # Return in chronological order
             
         except Exception as e:
-            logger.error(f"Error retrieving chat history: {e}")
+            logger.error("Error retrieving chat history: %s", e)
             return []
     
     async def search_similar_documents(
@@ -382,16 +768,19 @@ class RAGRetriever:
             score_threshold=MIN_SIMILARITY_SCORE
         )
     
-    def _calculate_time(self, start_time: datetime) -> int:
-        """Calculate elapsed time in milliseconds."""
-        elapsed = datetime.utcnow() - start_time
-        return int(elapsed.total_seconds() * 1000)
+    @staticmethod
+    def _calculate_time(start_ns: int) -> int:
+        """Calculate elapsed time in milliseconds from a perf_counter_ns start."""
+        return (time.perf_counter_ns() - start_ns) // 1_000_000
     
-    def close(self):
-        """Close all client connections."""
+    async def close(self):
+        """
+        Wait for pending background writes.
+        Shared clients are closed by rag.clients.close_clients.
+        """
         try:
-            self.qdrant_client.close()
-            self.mongo_client.close()
-            logger.info("Retriever connections closed")
+            if self._bg_tasks:
+                await asyncio.gather(*self._bg_tasks, return_exceptions=True)
+            logger.info("Retriever closed")
         except Exception as e:
-            logger.error(f"Error closing connections: {e}")
+            logger.error("Error closing retriever: %s", e)
@@ -0,0 +1,87 @@
+"""
+Qdrant Schema Module.
+Creates the document and query cache collections with their vector,
+quantization and payload index settings, shared by the indexer, the
+retriever and the maintenance scripts.
+"""
+
+from typing import Dict
+
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Distance, VectorParams, models
+
+from config.settings import settings
+from config.constants import (
+    VECTOR_DIMENSION,
+    QUANTIZATION_QUANTILE,
+    DOCUMENT_PAYLOAD_INDEXES,
+    QUERY_CACHE_COLLECTION,
+    QUERY_CACHE_PAYLOAD_INDEXES
+)
+from config.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+async def create_payload_indexes(
+    client: AsyncQdrantClient,
+    collection_name: str,
+    indexes: Dict[str, str]
+):
+    """
+    Index filterable payload fields; re-creating an existing index is a no-op.
+    
+    Args:
+        client: Qdrant client
+        collection_name: Collection to index
+        indexes: Mapping of field name to payload schema type
+    """
+    for field_name, field_schema in indexes.items():
+        await client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=field_schema
+        )
+
+
+async def create_documents_collection(client: AsyncQdrantClient):
+    """
+    Create the document chunk collection and its payload indexes.
+
+    Args:
+        client: Qdrant client
+    """
+    logger.info("Creating Qdrant collection: %s", settings.qdrant_collection)
+    await client.create_collection(
+        collection_name=settings.qdrant_collection,
+        vectors_config=VectorParams(
+            size=VECTOR_DIMENSION,
+            distance=Distance.COSINE
+        ),
+        quantization_config=models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=QUANTIZATION_QUANTILE,
+                always_ram=True
+            )
+        )
+    )
+    await create_payload_indexes(client, settings.qdrant_collection, DOCUMENT_PAYLOAD_INDEXES)
+
+
+async def create_query_cache_collection(client: AsyncQdrantClient):
+    """
+    Create the semantic response cache collection and its payload indexes.
+
+    Args:
+        client: Qdrant client
+    """
+    logger.info("Creating Qdrant collection: %s", QUERY_CACHE_COLLECTION)
+    await client.create_collection(
+        collection_name=QUERY_CACHE_COLLECTION,
+        vectors_config=VectorParams(
+            size=VECTOR_DIMENSION,
+            distance=Distance.COSINE
+        )
+    )
+    await create_payload_indexes(client, QUERY_CACHE_COLLECTION, QUERY_CACHE_PAYLOAD_INDEXES)
@@ -4,24 +4,285 @@ Helper functions for text processing, file handling, and common operations.
 """
 
 import re
+import os
 import hashlib
-from typing import List, Dict, Any, Optional
+import multiprocessing
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union, BinaryIO
 from pathlib import Path
 import asyncio
-from datetime import datetime
 import uuid
 import io
 
-# Optional dependencies for file extraction
-try:
-    from pypdf import PdfReader
-except ImportError:
-    PdfReader = None
+import numpy as np
+
+from config.constants import PDF_MAX_PAGES_PER_SLAB
+
+# Optional dependencies (numba for the boundary scans; pypdf, docx2txt,
+# python-docx for extraction) are imported on first use, so they only load
+# when a large text is chunked or a file is processed.
+
+# clean_text patterns
+_WHITESPACE_RE = re.compile(r'\s+')
+_SPECIAL_CHARS_RE = re.compile(r'[^\w\s.,!?;:\'"()\-\n]')
+_SPACE_RUN_RE = re.compile(r' {2,}')
+
+# validate_api_key allowlist: sk- prefixed keys or bare hex keys
+_API_KEY_RE = re.compile(r'(?:sk-[A-Za-z0-9_\-]{20,}|[A-Fa-f0-9]{32,64})\Z')
+
+# ASCII translation table doing both clean_text substitutions in one pass:
+# whitespace becomes a space, special characters are deleted
+_ASCII_CLEAN_TABLE = {
+    c: (' ' if _WHITESPACE_RE.match(chr(c)) else None)
+    for c in range(128)
+    if _WHITESPACE_RE.match(chr(c)) or _SPECIAL_CHARS_RE.match(chr(c))
+}
+
+# PDFs with more pages than this are extracted across a process pool
+_PDF_PARALLEL_MIN_PAGES = 16
+_PDF_MAX_WORKERS = 8
+
+# Owned by the application lifespan via start_pdf_pool/shutdown_pdf_pool;
+# without a pool, PDFs are extracted in-process
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_workers = 0
+
+# Entries kept by the extracted-text caches
+_EXTRACT_CACHE_SIZE = 128
+
+# Extracted text of uploads, keyed by a digest of the full bytes
+_content_text_cache: "OrderedDict[bytes, str]" = OrderedDict()
+_content_text_lock = threading.Lock()
+
+# Upload streams are hashed this many bytes at a time
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+# Token counting: tiktoken encoding, loaded by load_token_encoder at startup
+_TOKEN_ENCODING = "cl100k_base"
+_token_encoder = None
+
+# Plain-text file extensions read directly without a parser
+_TEXT_EXTS = frozenset({".txt", ".md"})
+
+# Preferred chunk break points, in priority order
+_CHUNK_SEPARATORS = (". ", ".\n", "\n\n", "\n", " ")
+
+# Texts at or below this many characters skip the JIT-compiled scan
+_JIT_MIN_CHARS = 64 * 1024
+
+# Content-defined chunking: rolling polynomial hash over a fixed window,
+# arithmetic mod 2**64
+_CDC_WINDOW = 48
+_CDC_PRIME = 1099511628211
+_CDC_PRIME_W = pow(_CDC_PRIME, _CDC_WINDOW, 1 << 64)
+_U64_MASK = (1 << 64) - 1
+
+# Separators as concatenated code points plus [start, end) bounds per separator
+_SEP_CODES = np.array([ord(c) for sep in _CHUNK_SEPARATORS for c in sep], dtype=np.uint32)
+_SEP_BOUNDS = np.cumsum([0] + [len(sep) for sep in _CHUNK_SEPARATORS]).astype(np.int64)
+
+
+def _chunk_offsets_kernel(
+    codes: np.ndarray,
+    chunk_size: int,
+    overlap: int,
+    sep_codes: np.ndarray,
+    sep_bounds: np.ndarray
+) -> np.ndarray:
+    """
+    Compute (start, end) chunk windows over an array of code points.
+    
+    Mirrors the pure-Python boundary search: each window ends at the last
+    occurrence of the highest-priority separator past its midpoint.
+    """
+    n = codes.shape[0]
+    capacity = 16
+    out = np.empty((capacity, 2), dtype=np.int64)
+    count = 0
+    start = 0
+    
+    while start < n:
+        end = start + chunk_size
+        
+        if end < n:
+            for s in range(sep_bounds.shape[0] - 1):
+                sep_start = sep_bounds[s]
+                sep_len = sep_bounds[s + 1] - sep_start
+                
+                # Scan backwards; matches at or before the midpoint are too early
+                pos = end - sep_len
+                while pos > start + chunk_size // 2:
+                    k = 0
+                    while k < sep_len and codes[pos + k] == sep_codes[sep_start + k]:
+                        k += 1
+                    if k == sep_len:
+                        break
+                    pos -= 1
+                
+                if pos > start + chunk_size // 2:
+                    end = pos + sep_len
+                    break
+        else:
+            end = n
+        
+        if count == capacity:
+            grown = np.empty((capacity * 2, 2), dtype=np.int64)
+            grown[:capacity] = out
+            out = grown
+            capacity *= 2
+        out[count, 0] = start
+        out[count, 1] = end
+        count += 1
+        
+        start = end - overlap if end < n else end
+    
+    return out[:count]
+
 
-try:
-    import docx2txt
-except ImportError:
-    docx2txt = None
+def _chunk_offsets(text: str, chunk_size: int, overlap: int) -> List[tuple]:
+    """Compute (start, end) chunk windows, JIT-compiled for large texts when numba is available."""
+    # Below the threshold str.rfind is as fast and skips numba import and JIT warmup
+    kernels = _jit_kernels() if len(text) > _JIT_MIN_CHARS else None
+    if kernels is None:
+        return _chunk_offsets_py(text, chunk_size, overlap)
+    
+    # One array element per character, so offsets index the str; ASCII text
+    # (the common case after clean_text) fits in a byte per character
+    if text.isascii():
+        codes = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+    else:
+        codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    return kernels[0](codes, chunk_size, overlap, _SEP_CODES, _SEP_BOUNDS).tolist()
+
+
+def _cdc_offsets_kernel(
+    codes: np.ndarray,
+    min_size: int,
+    max_size: int,
+    mask: np.uint64,
+    prime: np.uint64,
+    prime_w: np.uint64
+) -> np.ndarray:
+    """
+    Compute content-defined (start, end) chunk windows over code points.
+    
+    Cuts after any position where the rolling hash of the last
+    _CDC_WINDOW characters has its mask bits clear, clamped to
+    [min_size, max_size] characters per chunk.
+    """
+    n = codes.shape[0]
+    out = np.empty((n // min_size + 2, 2), dtype=np.int64)
+    count = 0
+    start = 0
+    h = np.uint64(0)
+    
+    for i in range(n):
+        h = h * prime + np.uint64(codes[i])
+        if i >= _CDC_WINDOW:
+            # Drop the character leaving the window
+            h = h - np.uint64(codes[i - _CDC_WINDOW]) * prime_w
+        
+        length = i + 1 - start
+        if length >= min_size and ((h & mask) == 0 or length >= max_size):
+            out[count, 0] = start
+            out[count, 1] = i + 1
+            count += 1
+            start = i + 1
+    
+    if start < n:
+        out[count, 0] = start
+        out[count, 1] = n
+        count += 1
+    
+    return out[:count]
+
+
+@lru_cache(maxsize=None)
+def _jit_kernels() -> Optional[Tuple[Any, Any]]:
+    """Import numba and wrap the scan kernels on first use; None without numba."""
+    try:
+        import numba
+    except ImportError:
+        return None
+    
+    return (
+        numba.njit(cache=True)(_chunk_offsets_kernel),
+        numba.njit(cache=True)(_cdc_offsets_kernel)
+    )
+
+
+def _cdc_offsets(text: str, avg_size: int, min_size: int, max_size: int) -> List[tuple]:
+    """Compute content-defined chunk windows, JIT-compiled for large texts when numba is available."""
+    mask = (1 << max(avg_size.bit_length() - 1, 0)) - 1
+    # The JIT kernel sizes its output by n // min_size
+    min_size = max(1, min_size)
+    
+    kernels = _jit_kernels() if len(text) > _JIT_MIN_CHARS else None
+    if kernels is None:
+        return _cdc_offsets_py(text, min_size, max_size, mask)
+    
+    codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    return kernels[1](
+        codes, min_size, max_size,
+        np.uint64(mask), np.uint64(_CDC_PRIME), np.uint64(_CDC_PRIME_W)
+    ).tolist()
+
+
+def _cdc_offsets_py(text: str, min_size: int, max_size: int, mask: int) -> List[tuple]:
+    """Compute content-defined chunk windows in pure Python."""
+    offsets = []
+    start = 0
+    h = 0
+    
+    for i, ch in enumerate(text):
+        h = (h * _CDC_PRIME + ord(ch)) & _U64_MASK
+        if i >= _CDC_WINDOW:
+            h = (h - ord(text[i - _CDC_WINDOW]) * _CDC_PRIME_W) & _U64_MASK
+        
+        length = i + 1 - start
+        if length >= min_size and ((h & mask) == 0 or length >= max_size):
+            offsets.append((start, i + 1))
+            start = i + 1
+    
+    if start < len(text):
+        offsets.append((start, len(text)))
+    
+    return offsets
+
+
+def _chunk_offsets_py(text: str, chunk_size: int, overlap: int) -> List[tuple]:
+    """Compute (start, end) chunk windows in pure Python."""
+    offsets = []
+    start = 0
+    
+    while start < len(text):
+        # Calculate end position
+        end = start + chunk_size
+        
+        # If not at the end, try to break at a natural point
+        if end < len(text):
+            # Look for sentence endings
+            for sep in _CHUNK_SEPARATORS:
+                # Search in place rather than on a sliced copy of the window
+                last_sep = text.rfind(sep, start, end)
+                if last_sep - start > chunk_size // 2:  # Only use if not too early
+                    end = last_sep + len(sep)
+                    break
+        else:
+            end = len(text)
+        
+        offsets.append((start, end))
+        
+        # Move start position with overlap
+        start = end - overlap if end < len(text) else end
+    
+    return offsets
 
 
 def generate_document_id(source: str, content: str) -> str:
@@ -35,8 +296,13 @@ def generate_document_id(source: str, content: str) -> str:
     Returns:
         Unique hash-based ID
     """
-    combined = f"{source}:{content[:500]}"
-    return hashlib.md5(combined.encode()).hexdigest()
+    # Only the leading content identifies the document, so edits further in
+    # keep the same ID and point IDs
+    h = hashlib.blake2b(digest_size=8)
+    h.update(source.encode())
+    h.update(b"\x00")
+    h.update(content[:500].encode("utf-8", "ignore"))
+    return h.hexdigest()
 
 
 def generate_chunk_id(document_id: str, chunk_index: int) -> str:
@@ -54,16 +320,37 @@ def generate_chunk_id(document_id: str, chunk_index: int) -> str:
 
 
 def generate_uuid() -> str:
-    """Generate a UUID string."""
-    return str(uuid.uuid4())
+    """
+    Generate a time-ordered UUID string (UUIDv7 layout).
+    
+    The leading 48 bits are the Unix time in milliseconds, so IDs created
+    later sort later and index inserts stay append-mostly.
+    
+    Returns:
+        UUID string
+    """
+    raw = bytearray((time.time_ns() // 1_000_000).to_bytes(6, "big") + os.urandom(10))
+    raw[6] = (raw[6] & 0x0F) | 0x70  # version 7
+    raw[8] = (raw[8] & 0x3F) | 0x80  # RFC 4122 variant
+    return str(uuid.UUID(bytes=bytes(raw)))
+
+
+@dataclass(slots=True)
+class Chunk:
+    """A chunk of document text and its position in the cleaned source."""
+    text: str
+    chunk_index: int
+    start_char: int
+    end_char: int
 
 
 def chunk_text(
     text: str, 
     chunk_size: int = 512, 
     overlap: int = 50,
-    separator: str = "\n"
-) -> List[Dict[str, Any]]:
+    separator: str = "\n",
+    use_cdc: bool = False
+) -> List[Chunk]:
     """
     Split text into overlapping chunks with metadata.
     
@@ -72,64 +359,111 @@ def chunk_text(
         chunk_size: Maximum characters per chunk
         overlap: Number of overlapping characters between chunks
         separator: Preferred split point
+        use_cdc: Cut at content-defined boundaries instead (no overlap)
+        
+    Returns:
+        List of chunks with text and position metadata
+    """
+    texts, offsets = chunk_text_soa(text, chunk_size, overlap, use_cdc)
+    return _to_chunks(texts, offsets)
+
+
+def chunk_text_cdc(
+    text: str,
+    avg_size: int = 512,
+    min_size: int = 256,
+    max_size: int = 1024
+) -> List[Chunk]:
+    """
+    Split text at content-defined boundaries.
+    
+    Boundaries depend only on the surrounding characters, so an edit
+    moves at most the chunks around it and the rest keep their text.
+    
+    Args:
+        text: Text to split
+        avg_size: Target spacing of hash-selected boundaries (power of two)
+        min_size: Minimum characters per chunk
+        max_size: Maximum characters per chunk
         
     Returns:
-        List of chunk dictionaries with text and metadata
+        List of chunks with text and position metadata
     """
     if not text or not text.strip():
         return []
     
+    text = clean_text(text)
+    return _to_chunks(*_split_windows(text, _cdc_offsets(text, avg_size, min_size, max_size)))
+
+
+def chunk_text_soa(
+    text: str,
+    chunk_size: int = 512,
+    overlap: int = 50,
+    use_cdc: bool = False
+) -> Tuple[List[str], np.ndarray]:
+    """
+    Split text into overlapping chunks, returned column-wise.
+    
+    Args:
+        text: Text to split
+        chunk_size: Maximum characters per chunk
+        overlap: Number of overlapping characters between chunks
+        use_cdc: Cut at content-defined boundaries instead (no overlap)
+        
+    Returns:
+        Tuple of (chunk texts, int32 array of shape (N, 3) holding
+        start_char, end_char and chunk_index per chunk)
+    """
+    if not text or not text.strip():
+        return [], np.empty((0, 3), dtype=np.int32)
+    
     # Clean the text
     text = clean_text(text)
     
     if len(text) <= chunk_size:
-        return [{
-            "text": text,
-            "chunk_index": 0,
-            "start_char": 0,
-            "end_char": len(text)
-        }]
-    
-    chunks = []
-    start = 0
-    chunk_index = 0
+        return [text], np.array([[0, len(text), 0]], dtype=np.int32)
     
-    while start < len(text):
-        # Calculate end position
-        end = start + chunk_size
-        
-        # If not at the end, try to break at a natural point
-        if end < len(text):
-            # Look for sentence endings
-            for sep in [". ", ".\n", "\n\n", "\n", " "]:
-                last_sep = text[start:end].rfind(sep)
-                if last_sep > chunk_size // 2:  # Only use if not too early
-                    end = start + last_sep + len(sep)
-                    break
-        else:
-            end = len(text)
-        
+    if use_cdc:
+        # chunk_size stays the hard cap; boundaries land every ~3/4 of it
+        windows = _cdc_offsets(text, chunk_size // 2, chunk_size // 4, chunk_size)
+    else:
+        windows = _chunk_offsets(text, chunk_size, overlap)
+    
+    return _split_windows(text, windows)
+
+
+def _split_windows(text: str, windows: List[tuple]) -> Tuple[List[str], np.ndarray]:
+    """Slice (start, end) windows out of text, dropping ones that strip to nothing."""
+    texts = []
+    rows = []
+    
+    for start, end in windows:
         chunk_text_content = text[start:end].strip()
         
         if chunk_text_content:
-            chunks.append({
-                "text": chunk_text_content,
-                "chunk_index": chunk_index,
-                "start_char": start,
-                "end_char": end
-            })
-            chunk_index += 1
-        
-        # Move start position with overlap
-        start = end - overlap if end < len(text) else end
+            rows.append((start, end, len(texts)))
+            texts.append(chunk_text_content)
     
-    return chunks
+    return texts, np.array(rows, dtype=np.int32).reshape(-1, 3)
+
+
+def _to_chunks(texts: List[str], offsets: np.ndarray) -> List[Chunk]:
+    """Build Chunk objects from columnar chunk data."""
+    return [
+        Chunk(chunk, chunk_index, start, end)
+        for chunk, (start, end, chunk_index) in zip(texts, offsets.tolist())
+    ]
 
 
 def clean_text(text: str) -> str:
     """
     Clean and normalize text.
     
+    Special characters are removed, then every whitespace run, newlines
+    included, collapses to a single space, so the output never contains
+    newlines.
+    
     Args:
         text: Raw text input
         
@@ -139,14 +473,12 @@ def clean_text(text: str) -> str:
     if not text:
         return ""
     
-    # Remove excessive whitespace
-    text = re.sub(r'\s+', ' ', text)
-    
-    # Remove special characters but keep punctuation
-    text = re.sub(r'[^\w\s.,!?;:\'"()\-\n]', '', text)
-    
-    # Remove multiple newlines
-    text = re.sub(r'\n{3,}', '\n\n', text)
+    if text.isascii():
+        # Single C-level pass, then collapse the resulting space runs
+        text = _SPACE_RUN_RE.sub(' ', text.translate(_ASCII_CLEAN_TABLE))
+    else:
+        # \w and \s are Unicode-aware here, so fall back to the regexes
+        text = _WHITESPACE_RE.sub(' ', _SPECIAL_CHARS_RE.sub('', text))
     
     return text.strip()
 
@@ -161,59 +493,177 @@ def extract_text_from_file(file_path: Path) -> Optional[str]:
     Returns:
         Extracted text content or None if unsupported
     """
-    suffix = file_path.suffix.lower()
+    try:
+        stat = file_path.stat()
+    except OSError as e:
+        print(f"Error extracting text from {file_path}: {e}")
+        return None
     
+    # A changed file gets a new mtime or size and so a new cache entry.
+    # Failures raise out of the cached call, so they are never memoized.
     try:
-        if suffix == ".txt" or suffix == ".md":
-            return file_path.read_text(encoding="utf-8")
-        
-        elif suffix == ".pdf":
-            return extract_pdf_text(file_path)
-        
-        elif suffix == ".docx":
-            return extract_docx_text(file_path)
-        
-        else:
-            return None
-            
+        return _extract_text_cached(str(file_path.resolve()), stat.st_mtime_ns, stat.st_size)
     except Exception as e:
         print(f"Error extracting text from {file_path}: {e}")
         return None
 
 
+@lru_cache(maxsize=_EXTRACT_CACHE_SIZE)
+def _extract_text_cached(path: str, mtime_ns: int, size: int) -> Optional[str]:
+    """Extract text from a file; memoized on path, mtime and size."""
+    file_path = Path(path)
+    suffix = file_path.suffix.lower()
+    
+    if suffix in _TEXT_EXTS:
+        return file_path.read_text(encoding="utf-8")
+    
+    elif suffix == ".pdf":
+        return extract_pdf_text(file_path)
+    
+    elif suffix == ".docx":
+        return extract_docx_text(file_path)
+    
+    else:
+        return None
+
+
 def extract_pdf_text(file_path: Path) -> str:
     """Extract text from PDF file."""
+    return "\n\n".join(iter_pdf_text(file_path))
+
+
+def iter_pdf_text(
+    file_path: Path,
+    max_pages_per_slab: int = PDF_MAX_PAGES_PER_SLAB
+) -> Iterator[str]:
+    """
+    Extract text from a PDF one slab of pages at a time.
+    
+    Only one slab's page texts are held in memory, so large PDFs can be
+    consumed incrementally.
+    
+    Args:
+        file_path: Path to the PDF
+        max_pages_per_slab: Pages extracted per yielded slab
+        
+    Yields:
+        Non-empty page texts of each slab, joined by blank lines
+    """
     try:
         from pypdf import PdfReader
-        
-        reader = PdfReader(str(file_path))
-        text_parts = []
-        
-        for page in reader.pages:
-            text = page.extract_text()
-            if text:
-                text_parts.append(text)
-        
-        return "\n\n".join(text_parts)
     except ImportError:
         raise ImportError("pypdf is required for PDF processing. Install with: pip install pypdf")
+    
+    reader = PdfReader(str(file_path))
+    page_count = len(reader.pages)
+    
+    for first in range(0, page_count, max_pages_per_slab):
+        last = min(first + max_pages_per_slab, page_count)
+        slab = "\n\n".join(
+            text for text in _extract_pdf_pages(reader, str(file_path), first, last) if text
+        )
+        if slab:
+            yield slab
+
+
+def start_pdf_pool(max_workers: int):
+    """
+    Create the PDF extraction process pool.
+    
+    Args:
+        max_workers: Worker processes for this process; capped at
+            _PDF_MAX_WORKERS, and fewer than 2 leaves extraction in-process
+    """
+    global _pdf_pool, _pdf_pool_workers
+    workers = min(_PDF_MAX_WORKERS, max_workers)
+    if _pdf_pool is not None or workers < 2:
+        return
+    
+    # spawn: forking a process that runs an event loop and threads is unsafe.
+    # Non-fork executors start worker processes on demand, not up front.
+    _pdf_pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn")
+    )
+    _pdf_pool_workers = workers
+
+
+def shutdown_pdf_pool():
+    """Shut down the PDF extraction pool, if one was started."""
+    global _pdf_pool, _pdf_pool_workers
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(cancel_futures=True)
+        _pdf_pool = None
+        _pdf_pool_workers = 0
+
+
+def _extract_pdf_page_range(source: Union[str, bytes], first: int, last: int) -> List[str]:
+    """Extract text from pages [first, last) of a PDF path or PDF bytes. Runs in a worker."""
+    from pypdf import PdfReader
+    
+    reader = PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+    return [reader.pages[i].extract_text() for i in range(first, last)]
+
+
+def _extract_pdf_pages(
+    reader: Any,
+    source: Union[str, bytes, None] = None,
+    first: int = 0,
+    last: Optional[int] = None
+) -> List[str]:
+    """
+    Extract text from pages [first, last) of an open PDF.
+    
+    When the pool is running, large ranges are split into one contiguous
+    page range per worker, so each worker parses the file once; otherwise
+    pages are extracted in-process.
+    
+    Args:
+        reader: Open pypdf PdfReader
+        source: PDF path or bytes for workers to reopen; None forces serial
+        first: First page index
+        last: Page index to stop before (default: end of document)
+        
+    Returns:
+        Page texts in page order
+    """
+    if last is None:
+        last = len(reader.pages)
+    page_count = last - first
+    pool = _pdf_pool
+    
+    if pool is None or source is None or page_count <= _PDF_PARALLEL_MIN_PAGES:
+        return [reader.pages[i].extract_text() for i in range(first, last)]
+    
+    step = -(-page_count // _pdf_pool_workers)
+    futures = [
+        pool.submit(_extract_pdf_page_range, source, start, min(start + step, last))
+        for start in range(first, last, step)
+    ]
+    return [text for future in futures for text in future.result()]
 
 
 def extract_docx_text(file_path: Path) -> str:
-    """Extract text from DOCX file."""
+    """Extract text from DOCX file, preferring docx2txt over python-docx."""
+    try:
+        import docx2txt
+    except ImportError:
+        docx2txt = None
+    
+    # Same fast path as extract_text_from_docx
+    if docx2txt is not None:
+        return docx2txt.process(str(file_path)).strip()
+    
     try:
         from docx import Document
         
         doc = Document(str(file_path))
-        text_parts = []
-        
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                text_parts.append(paragraph.text)
-        
-        return "\n\n".join(text_parts)
+        return "\n\n".join(p.text for p in doc.paragraphs if p.text.strip())
     except ImportError:
-        raise ImportError("python-docx is required for DOCX processing. Install with: pip install python-docx")
+        raise ImportError("docx2txt or python-docx is required for DOCX processing. Install with: pip install docx2txt")
+
+
+_SOURCE_LINE_FORMAT = "[{}] {} (Score: {:.2f})\n    {}...".format
 
 
 def format_sources_for_response(sources: List[Dict]) -> str:
@@ -229,15 +679,16 @@ def format_sources_for_response(sources: List[Dict]) -> str:
     if not sources:
         return "No sources available."
     
-    formatted = []
-    for i, source in enumerate(sources, 1):
-        source_name = source.get("source", "Unknown")
-        score = source.get("score", 0)
-        text_preview = source.get("text", "")[:150]
-        
-        formatted.append(f"[{i}] {source_name} (Score: {score:.2f})\n    {text_preview}...")
+    # Pull each field into its own column, then format row-wise in one join
+    names = [source.get("source", "Unknown") for source in sources]
+    scores = [source.get("score", 0) for source in sources]
+    previews = [source.get("text", "")[:150] for source in sources]
     
-    return "\n".join(formatted)
+    line = _SOURCE_LINE_FORMAT
+    return "\n".join(
+        line(i, name, score, preview)
+        for i, (name, score, preview) in enumerate(zip(names, scores, previews), 1)
+    )
 
 
 def truncate_text(text: str, max_length: int = 500, suffix: str = "...") -> str:
@@ -252,28 +703,70 @@ def truncate_text(text: str, max_length: int = 500, suffix: str = "...") -> str:
     Returns:
         Truncated text
     """
+    # Returning early avoids copying text that already fits
     if len(text) <= max_length:
         return text
-    return text[:max_length - len(suffix)] + suffix
+    cut = max_length - len(suffix)
+    return text[:cut] + suffix if cut > 0 else suffix[:max_length]
+
+
+def normalize_embeddings(embeddings: List[List[float]]) -> np.ndarray:
+    """
+    Cast embeddings to float32 and scale each to unit length.
+    
+    Args:
+        embeddings: Embedding vectors, one per row
+        
+    Returns:
+        2-D float32 array of L2-normalized vectors
+    """
+    arr = np.asarray(embeddings, dtype=np.float32)
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    arr /= np.linalg.norm(arr, axis=1, keepdims=True) + 1e-12
+    return arr
+
+
+def load_token_encoder():
+    """
+    Load the tiktoken encoder once; False if it is unavailable.
+    
+    The first load may download the BPE file, so the application calls
+    this at startup (off the event loop) rather than on a request.
+    """
+    global _token_encoder
+    if _token_encoder is None:
+        try:
+            import tiktoken
+            _token_encoder = tiktoken.get_encoding(_TOKEN_ENCODING)
+        except Exception:
+            # Missing package or no access to the BPE file
+            _token_encoder = False
+    return _token_encoder
 
 
 def calculate_token_estimate(text: str) -> int:
     """
-    Estimate token count (rough approximation).
+    Count tokens with tiktoken, or estimate them if it is unavailable.
     
     Args:
         text: Text to estimate
         
     Returns:
-        Estimated token count
+        Token count
     """
+    encoder = load_token_encoder()
+    if encoder:
+        return len(encoder.encode(text, disallowed_special=()))
+    
     # Rough estimate: ~4 characters per token for English
     return len(text) // 4
 
 
 def validate_api_key(api_key: str) -> bool:
     """
-    Basic validation of API key format.
+    Validate API key format: an ``sk-`` prefixed key (OpenAI, OpenRouter)
+    or a 32-64 character hex key.
     
     Args:
         api_key: API key to validate
@@ -281,14 +774,17 @@ def validate_api_key(api_key: str) -> bool:
     Returns:
         True if valid format
     """
-    if not api_key or len(api_key) < 10:
+    # No accepted format is shorter than 23 characters
+    if not api_key or len(api_key) < 23:
         return False
-    return True
+    return _API_KEY_RE.match(api_key) is not None
 
 
 def get_timestamp() -> str:
-    """Get current UTC timestamp in ISO format."""
-    return datetime.utcnow().isoformat()
+    """Get current UTC timestamp in ISO 8601 format with millisecond precision."""
+    # Formatting from time_ns skips building a datetime object
+    seconds, nanos = divmod(time.time_ns(), 1_000_000_000)
+    return f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))}.{nanos // 1_000_000:03d}Z"
 
 
 def safe_dict_get(d: Dict, *keys, default=None):
@@ -303,6 +799,16 @@ def safe_dict_get(d: Dict, *keys, default=None):
     Returns:
         Value at nested key or default
     """
+    # Fast paths for the usual one- and two-level lookups
+    depth = len(keys)
+    if depth == 1:
+        return d.get(keys[0], default) if isinstance(d, dict) else default
+    if depth == 2:
+        if not isinstance(d, dict):
+            return default
+        inner = d.get(keys[0], default)
+        return inner.get(keys[1], default) if isinstance(inner, dict) else default
+    
     for key in keys:
         if isinstance(d, dict):
             d = d.get(key, default)
@@ -311,15 +817,40 @@ def safe_dict_get(d: Dict, *keys, default=None):
     return d
 
 
+@lru_cache(maxsize=16)
+def _backoff_schedule(
+    max_retries: int,
+    delay: float,
+    backoff: float,
+    max_delay: float
+) -> Tuple[float, ...]:
+    """
+    Compute the capped delay before each retry, before jitter.
+    
+    Args:
+        max_retries: Maximum number of retries
+        delay: Initial delay between retries
+        backoff: Backoff multiplier
+        max_delay: Upper bound on any single delay
+        
+    Returns:
+        One delay per retry
+    """
+    return tuple(min(max_delay, delay * backoff ** i) for i in range(max_retries))
+
+
 async def retry_async(
     func,
     max_retries: int = 3,
     delay: float = 1.0,
     backoff: float = 2.0,
-    exceptions: tuple = (Exception,)
+    exceptions: tuple = (Exception,),
+    max_delay: float = 30.0,
+    deadline: Optional[float] = None,
+    jitter: float = 0.25
 ):
     """
-    Retry an async function with exponential backoff.
+    Retry an async function with capped, jittered exponential backoff.
     
     Args:
         func: Async function to retry
@@ -327,15 +858,21 @@ async def retry_async(
         delay: Initial delay between retries
         backoff: Backoff multiplier
         exceptions: Tuple of exceptions to catch
+        max_delay: Upper bound on any single delay, before jitter
+        deadline: Total seconds allowed from the first attempt; no retry
+            is scheduled if its delay would overrun it
+        jitter: Relative random spread applied to each delay
         
     Returns:
         Function result
         
     Raises:
-        Last exception if all retries fail
+        Last exception if all retries fail or the deadline would be missed
     """
+    schedule = _backoff_schedule(max_retries, delay, backoff, max_delay)
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + deadline if deadline is not None else None
     last_exception = None
-    current_delay = delay
     
     for attempt in range(max_retries + 1):
         try:
@@ -345,22 +882,105 @@ async def retry_async(
             if attempt == max_retries:
                 break
             
+            current_delay = schedule[attempt]
+            if jitter:
+                current_delay *= 1 + random.uniform(-jitter, jitter)
+            
+            if give_up_at is not None and loop.time() + current_delay > give_up_at:
+                break
+            
             await asyncio.sleep(current_delay)
-            current_delay *= backoff
             
     raise last_exception
 
 
-def extract_text_from_pdf(file_bytes: bytes) -> str:
-    """Extract text from PDF file bytes."""
-    if not PdfReader:
+def _as_stream(file_data: Union[bytes, BinaryIO]) -> BinaryIO:
+    """Wrap raw bytes in a stream; pass file-like objects through."""
+    if isinstance(file_data, (bytes, bytearray)):
+        return io.BytesIO(file_data)
+    return file_data
+
+
+def _content_key(kind: bytes, file_data: Union[bytes, BinaryIO]) -> Optional[bytes]:
+    """
+    Digest the full payload of bytes or a seekable stream.
+    
+    Streams are hashed in blocks and rewound; None means the stream
+    cannot be rewound and so cannot be cached.
+    """
+    digest = hashlib.blake2b(digest_size=16, person=kind)
+    if isinstance(file_data, (bytes, bytearray)):
+        digest.update(file_data)
+        return digest.digest()
+    
+    if not file_data.seekable():
+        return None
+    start = file_data.tell()
+    for block in iter(lambda: file_data.read(_HASH_BLOCK_SIZE), b""):
+        digest.update(block)
+    file_data.seek(start)
+    return digest.digest()
+
+
+def _with_content_cache(kind: bytes, file_data: Union[bytes, BinaryIO], extractor) -> str:
+    """
+    Run an extractor, memoizing results keyed by a digest of the payload.
+    
+    Failed extractions raise and are not cached.
+    """
+    key = _content_key(kind, file_data)
+    if key is None:
+        return extractor(file_data)
+    
+    with _content_text_lock:
+        text = _content_text_cache.get(key)
+        if text is not None:
+            _content_text_cache.move_to_end(key)
+            return text
+    
+    text = extractor(file_data)
+    
+    with _content_text_lock:
+        _content_text_cache[key] = text
+        while len(_content_text_cache) > _EXTRACT_CACHE_SIZE:
+            _content_text_cache.popitem(last=False)
+    return text
+
+
+def _clear_content_text_cache():
+    """Drop all cached text extracted from uploads."""
+    with _content_text_lock:
+        _content_text_cache.clear()
+
+
+def extract_text_from_pdf(file_data: Union[bytes, BinaryIO]) -> str:
+    """Extract text from PDF file bytes or a binary file-like object."""
+    return _with_content_cache(b"pdf", file_data, _extract_text_from_pdf)
+
+
+def _extract_text_from_pdf(file_data: Union[bytes, BinaryIO]) -> str:
+    """Extract text from PDF file bytes or a binary file-like object, uncached."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
         raise ImportError("pypdf library not installed")
     
     try:
-        reader = PdfReader(io.BytesIO(file_bytes))
+        stream = _as_stream(file_data)
+        reader = PdfReader(stream)
+        
+        # Workers need the raw bytes to reopen the document; without a pool,
+        # skip holding a second copy of the file
+        source = None
+        if _pdf_pool is not None and len(reader.pages) > _PDF_PARALLEL_MIN_PAGES:
+            if isinstance(file_data, (bytes, bytearray)):
+                source = bytes(file_data)
+            else:
+                stream.seek(0)
+                source = stream.read()
+        
         text = ""
-        for page in reader.pages:
-            content = page.extract_text()
+        for content in _extract_pdf_pages(reader, source):
             if content:
                 text += content + "\n"
         return text.strip()
@@ -368,13 +988,26 @@ def extract_text_from_pdf(file_bytes: bytes) -> str:
         raise ValueError(f"Failed to extract text from PDF: {str(e)}")
 
 
-def extract_text_from_docx(file_bytes: bytes) -> str:
-    """Extract text from DOCX file bytes."""
-    if not docx2txt:
+def extract_text_from_docx(file_data: Union[bytes, BinaryIO]) -> str:
+    """Extract text from DOCX file bytes or a binary file-like object."""
+    return _with_content_cache(b"docx", file_data, _extract_text_from_docx)
+
+
+def _extract_text_from_docx(file_data: Union[bytes, BinaryIO]) -> str:
+    """Extract text from DOCX file bytes or a binary file-like object, uncached."""
+    try:
+        import docx2txt
+    except ImportError:
         raise ImportError("docx2txt library not installed")
     
     try:
         # docx2txt takes a file path or file-like object
-        return docx2txt.process(io.BytesIO(file_bytes)).strip()
+        return docx2txt.process(_as_stream(file_data)).strip()
     except Exception as e:
         raise ValueError(f"Failed to extract text from DOCX: {str(e)}")
+
+
+# Cache hygiene hooks, e.g. for tests
+extract_text_from_file.cache_clear = _extract_text_cached.cache_clear
+extract_text_from_pdf.cache_clear = _clear_content_text_cache
+extract_text_from_docx.cache_clear = _clear_content_text_cache
@@ -7,53 +7,85 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config.settings import settings
-from config.constants import DOCUMENTS_COLLECTION, CHAT_HISTORY_COLLECTION, METADATA_COLLECTION
-from qdrant_client import QdrantClient
-from qdrant_client.models import FilterSelector, Filter
+from config.constants import (
+    DOCUMENTS_COLLECTION,
+    CHAT_HISTORY_COLLECTION,
+    CHAT_HISTORY_INDEX,
+    CHAT_HISTORY_INDEX_KEYS,
+    METADATA_COLLECTION,
+    QUERY_CACHE_COLLECTION
+)
+from qdrant_client import AsyncQdrantClient
 from pymongo import MongoClient
+from rag.schema import create_documents_collection, create_query_cache_collection
 
-async def clear_all_data():
-    print("🧹 Starting data cleanup...")
+async def _clear_mongo():
+    """Drop the MongoDB collections concurrently."""
+    print(f"Connecting to MongoDB: {settings.mongo_db_name}...")
+    mongo_client = MongoClient(settings.mongo_uri)
+    db = mongo_client[settings.mongo_db_name]
     
-    # 1. Clear MongoDB Collections
     try:
-        print(f"Connecting to MongoDB: {settings.mongo_db_name}...")
-        mongo_client = MongoClient(settings.mongo_uri)
-        db = mongo_client[settings.mongo_db_name]
-        
-        # Clear collections
-        result_docs = db[DOCUMENTS_COLLECTION].delete_many({})
-        result_history = db[CHAT_HISTORY_COLLECTION].delete_many({})
-        result_meta = db[METADATA_COLLECTION].delete_many({})
+        # Counts come from collection metadata; dropping is O(1) unlike delete_many
+        collections = [DOCUMENTS_COLLECTION, CHAT_HISTORY_COLLECTION, METADATA_COLLECTION]
+        counts = await asyncio.gather(
+            *(asyncio.to_thread(db[name].estimated_document_count) for name in collections)
+        )
+        await asyncio.gather(*(asyncio.to_thread(db.drop_collection, name) for name in collections))
         
-        print(f"✅ MongoDB: Deleted {result_docs.deleted_count} documents")
-        print(f"✅ MongoDB: Deleted {result_history.deleted_count} history entries")
-        print(f"✅ MongoDB: Deleted {result_meta.deleted_count} metadata entries")
+        # Dropping removed the index that a running API hints in get_chat_history
+        await asyncio.to_thread(
+            db[CHAT_HISTORY_COLLECTION].create_index,
+            CHAT_HISTORY_INDEX_KEYS,
+            name=CHAT_HISTORY_INDEX
+        )
         
+        print(f"✅ MongoDB: Deleted {counts[0]} documents")
+        print(f"✅ MongoDB: Deleted {counts[1]} history entries")
+        print(f"✅ MongoDB: Deleted {counts[2]} metadata entries")
+    finally:
         mongo_client.close()
-    except Exception as e:
-        print(f"❌ Error clearing MongoDB: {e}")
 
-    # 2. Clear Qdrant Collection
+
+async def _clear_qdrant():
+    """Drop and recreate the document and query cache collections."""
+    print(f"Connecting to Qdrant: {settings.qdrant_url}...")
+    qdrant_client = AsyncQdrantClient(
+        url=settings.qdrant_url,
+        api_key=settings.qdrant_api_key
+    )
+    
     try:
-        print(f"Connecting to Qdrant: {settings.qdrant_url}...")
-        qdrant_client = QdrantClient(
-            url=settings.qdrant_url,
-            api_key=settings.qdrant_api_key
+        # Dropping and recreating truncates segments instead of tombstoning every point.
+        # delete_collection on a missing collection is a no-op.
+        await asyncio.gather(
+            qdrant_client.delete_collection(collection_name=settings.qdrant_collection),
+            # Cached answers would otherwise still cite the deleted documents
+            qdrant_client.delete_collection(collection_name=QUERY_CACHE_COLLECTION)
         )
         
-        # Delete all points from the collection
-        qdrant_client.delete(
-            collection_name=settings.qdrant_collection,
-            points_selector=FilterSelector(
-                filter=Filter() # Empty filter = matches all
-            )
-        )
+        # Same schema the indexer and retriever create on startup
+        await create_documents_collection(qdrant_client)
         print(f"✅ Qdrant: Cleared collection '{settings.qdrant_collection}'")
-        
-        qdrant_client.close()
-    except Exception as e:
-        print(f"❌ Error clearing Qdrant: {e}")
+        if settings.semantic_cache_enabled:
+            await create_query_cache_collection(qdrant_client)
+        print(f"✅ Qdrant: Cleared collection '{QUERY_CACHE_COLLECTION}'")
+    finally:
+        await qdrant_client.close()
+
+
+async def clear_all_data():
+    print("🧹 Starting data cleanup...")
+    
+    # The two services are independent, so clear them at the same time
+    mongo_result, qdrant_result = await asyncio.gather(
+        _clear_mongo(), _clear_qdrant(), return_exceptions=True
+    )
+    
+    if isinstance(mongo_result, Exception):
+        print(f"❌ Error clearing MongoDB: {mongo_result}")
+    if isinstance(qdrant_result, Exception):
+        print(f"❌ Error clearing Qdrant: {qdrant_result}")
 
     print("✨ Cleanup complete!")
 
@@ -2,10 +2,21 @@
 Tests for RAG Indexing Module.
 """
 
-import pytest
+import io
+import random
+from pathlib import Path
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
+
+import numpy as np
+import pytest
+
+from config.settings import settings
 from rag.indexing import RAGIndexer
-from rag.utils import chunk_text, clean_text, generate_document_id
+from rag.utils import (
+    chunk_text, clean_text, generate_document_id, generate_uuid, normalize_embeddings, retry_async,
+    extract_text_from_file, extract_text_from_pdf, calculate_token_estimate,
+    get_timestamp, safe_dict_get, validate_api_key
+)
 
 
 class TestChunkText:
@@ -16,7 +27,7 @@ class TestChunkText:
         text = "This is a short text."
         chunks = chunk_text(text, chunk_size=100, overlap=10)
         assert len(chunks) == 1
-        assert chunks[0]["text"] == text
+        assert chunks[0].text == text
     
     def test_chunk_long_text(self):
         """Long text should be split into multiple chunks."""
@@ -42,9 +53,77 @@ class TestChunkText:
         text = "Hello world. This is a test."
         chunks = chunk_text(text, chunk_size=100, overlap=10)
         
-        assert "chunk_index" in chunks[0]
-        assert "start_char" in chunks[0]
-        assert "end_char" in chunks[0]
+        assert chunks[0].chunk_index == 0
+        assert chunks[0].start_char == 0
+        assert chunks[0].end_char == len(text)
+    
+    def test_chunk_offsets_match_python_fallback(self):
+        """Compiled boundary scan should agree with the pure-Python scan."""
+        from rag.utils import _chunk_offsets, _chunk_offsets_py
+        
+        text = "First sentence here. Second one.\nThird paragraph\n\nend " * 40
+        for sample in (text, text + "caf\u00e9"):
+            with patch("rag.utils._JIT_MIN_CHARS", 0):
+                offsets = [tuple(o) for o in _chunk_offsets(sample, 120, 15)]
+            assert offsets == _chunk_offsets_py(sample, 120, 15)
+    
+    def test_cdc_offsets_match_python_fallback(self):
+        """Compiled CDC scan should agree with the pure-Python scan."""
+        from rag.utils import _cdc_offsets, _cdc_offsets_py
+        
+        rng = random.Random(1)
+        text = "".join(rng.choice("abcdefgh \n.") for _ in range(5000))
+        with patch("rag.utils._JIT_MIN_CHARS", 0):
+            offsets = [tuple(o) for o in _cdc_offsets(text, 512, 256, 1024)]
+        assert offsets == _cdc_offsets_py(text, 256, 1024, 511)
+
+    def test_cdc_tiny_chunk_size(self):
+        """CDC chunking should not divide by zero when chunk_size // 4 is 0."""
+        from rag.utils import chunk_text_soa
+
+        text = "abcdefgh " * 20
+        with patch("rag.utils._JIT_MIN_CHARS", 0):
+            texts, offsets = chunk_text_soa(text, chunk_size=3, use_cdc=True)
+        assert texts
+        assert all(end - start <= 3 for start, end, _ in offsets)
+
+    def test_numba_not_imported_eagerly(self):
+        """Importing rag.utils should not pay for importing numba."""
+        import subprocess
+        import sys
+        
+        result = subprocess.run(
+            [sys.executable, "-c", "import sys, rag.utils; print('numba' in sys.modules)"],
+            capture_output=True, text=True, check=True
+        )
+        assert result.stdout.strip() == "False"
+    
+    def test_chunk_text_soa_columns(self):
+        """Columnar chunks should line up with chunk_text output."""
+        from rag.utils import chunk_text_soa
+        
+        text = "Sentence number one. " * 50
+        texts, offsets = chunk_text_soa(text, chunk_size=100, overlap=10)
+        chunks = chunk_text(text, chunk_size=100, overlap=10)
+        
+        assert offsets.shape == (len(texts), 3)
+        assert texts == [c.text for c in chunks]
+        assert offsets.tolist() == [[c.start_char, c.end_char, c.chunk_index] for c in chunks]
+    
+    def test_chunk_text_cdc_localizes_edits(self):
+        """An insertion should leave chunks away from the edit unchanged."""
+        from rag.utils import chunk_text_cdc
+        
+        rng = random.Random(0)
+        words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+        text = " ".join(rng.choice(words) for _ in range(3000))
+        edited = text[:2000] + " a brand new sentence. " + text[2000:]
+        
+        before = {c.text for c in chunk_text_cdc(text)}
+        after = {c.text for c in chunk_text_cdc(edited)}
+        
+        assert len(before & after) >= len(before) - 3
+        assert all(len(c.text) <= 1024 for c in chunk_text_cdc(edited))
 
 
 class TestCleanText:
@@ -68,6 +147,25 @@ class TestCleanText:
         assert "," in cleaned
         assert "!" in cleaned
         assert "?" in cleaned
+    
+    def test_strips_special_chars_before_collapsing(self):
+        """A removed special character should not leave a double space."""
+        assert clean_text("a @ b\n\n#c") == "a b c"
+    
+    def test_non_ascii_text(self):
+        """Unicode letters survive; Unicode symbols and whitespace are normalized."""
+        assert clean_text("Café  naïve — “quoted”\tend") == "Café naïve quoted end"
+
+
+class TestNormalizeEmbeddings:
+    """Tests for embedding normalization."""
+    
+    def test_unit_length_float32(self):
+        """Vectors should come back as unit-length float32 rows."""
+        arr = normalize_embeddings([[3.0, 4.0], [0.0, 2.0]])
+        assert arr.dtype == np.float32
+        assert np.allclose(np.linalg.norm(arr, axis=1), 1.0)
+        assert np.allclose(arr[0], [0.6, 0.8])
 
 
 class TestGenerateDocumentId:
@@ -86,18 +184,198 @@ class TestGenerateDocumentId:
         assert id1 != id2
 
 
+class TestGenerateUuid:
+    """Tests for time-ordered UUID generation."""
+    
+    def test_version_and_order(self):
+        """IDs should be version 7 and sort by creation time."""
+        import time
+        import uuid
+        
+        first = generate_uuid()
+        time.sleep(0.002)
+        second = generate_uuid()
+        
+        assert uuid.UUID(first).version == 7
+        assert first < second
+
+
+class TestGetTimestamp:
+    """Tests for UTC timestamp formatting."""
+    
+    def test_iso_format_with_milliseconds(self):
+        """Timestamps should be UTC ISO 8601 with millisecond precision."""
+        import re
+        from datetime import datetime, timezone
+        
+        with patch("rag.utils.time.time_ns", return_value=1_700_000_000_123_456_789):
+            stamp = get_timestamp()
+        
+        assert stamp == "2023-11-14T22:13:20.123Z"
+        assert re.fullmatch(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}Z", get_timestamp())
+        assert datetime.fromisoformat(stamp).tzinfo == timezone.utc
+
+
+class TestSafeDictGet:
+    """Tests for nested dictionary lookups."""
+    
+    def test_one_and_two_keys(self):
+        """Fast paths should find values and fall back to the default."""
+        data = {"a": {"b": 2}, "s": "text"}
+        
+        assert safe_dict_get(data, "a") == {"b": 2}
+        assert safe_dict_get(data, "x", default=0) == 0
+        assert safe_dict_get(data, "a", "b") == 2
+        assert safe_dict_get(data, "a", "x", default=0) == 0
+        assert safe_dict_get(data, "s", "b", default=0) == 0
+        assert safe_dict_get(None, "a", "b", default=0) == 0
+    
+    def test_deep_keys(self):
+        """Three or more keys should use the generic loop."""
+        data = {"a": {"b": {"c": 3}}}
+        
+        assert safe_dict_get(data, "a", "b", "c") == 3
+        assert safe_dict_get(data, "a", "x", "c", default=0) == 0
+
+
+class TestValidateApiKey:
+    """Tests for API key format validation."""
+    
+    def test_accepts_known_formats(self):
+        """sk- prefixed and hex keys should pass."""
+        assert validate_api_key("sk-or-v1-" + "a1" * 32)
+        assert validate_api_key("sk-proj-abcDEF_123-xyz7890abcd")
+        assert validate_api_key("0123456789abcdef" * 2)
+    
+    def test_rejects_malformed_keys(self):
+        """Empty, short, garbage and newline-terminated keys should fail."""
+        assert not validate_api_key("")
+        assert not validate_api_key(None)
+        assert not validate_api_key("sk-short")
+        assert not validate_api_key("not a real key at all!!")
+        assert not validate_api_key("0123456789abcdef" * 2 + "\n")
+
+
+class TestRetryAsync:
+    """Tests for the async retry helper."""
+    
+    @pytest.mark.asyncio
+    async def test_sleeps_follow_capped_schedule(self):
+        """Without jitter, sleeps should follow the capped backoff schedule."""
+        func = AsyncMock(side_effect=[ValueError(), ValueError(), ValueError(), "ok"])
+        
+        with patch("rag.utils.asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+            result = await retry_async(func, max_retries=3, delay=1.0, backoff=4.0, max_delay=5.0, jitter=0)
+        
+        assert result == "ok"
+        assert [c.args[0] for c in mock_sleep.await_args_list] == [1.0, 4.0, 5.0]
+    
+    @pytest.mark.asyncio
+    async def test_raises_last_exception(self):
+        """The last exception should propagate once retries are exhausted."""
+        func = AsyncMock(side_effect=ValueError("boom"))
+        
+        with patch("rag.utils.asyncio.sleep", new_callable=AsyncMock):
+            with pytest.raises(ValueError, match="boom"):
+                await retry_async(func, max_retries=2)
+        
+        assert func.await_count == 3
+
+
+class TestCalculateTokenEstimate:
+    """Tests for token counting."""
+    
+    def test_falls_back_without_tiktoken(self):
+        """Without tiktoken, the estimate should be ~4 characters per token."""
+        import sys
+        
+        with patch("rag.utils._token_encoder", None), patch.dict(sys.modules, {"tiktoken": None}):
+            assert calculate_token_estimate("a" * 40) == 10
+
+
+class TestExtractTextCache:
+    """Tests for the extracted-text caches."""
+    
+    @pytest.fixture(autouse=True)
+    def clear_caches(self):
+        """Start each test with empty caches."""
+        extract_text_from_file.cache_clear()
+        extract_text_from_pdf.cache_clear()
+        yield
+        extract_text_from_file.cache_clear()
+        extract_text_from_pdf.cache_clear()
+    
+    def test_unchanged_file_is_read_once(self, tmp_path):
+        """A second call on an unchanged file should hit the cache."""
+        path = tmp_path / "doc.txt"
+        path.write_text("hello", encoding="utf-8")
+        read_text = Path.read_text
+        
+        with patch.object(Path, "read_text", autospec=True, side_effect=read_text) as mock_read:
+            assert extract_text_from_file(path) == "hello"
+            assert extract_text_from_file(path) == "hello"
+        
+        assert mock_read.call_count == 1
+    
+    def test_failed_extraction_is_not_cached(self, tmp_path):
+        """A transient read error should not be served from the cache."""
+        path = tmp_path / "doc.txt"
+        path.write_text("hello", encoding="utf-8")
+        
+        with patch.object(Path, "read_text", side_effect=[OSError("busy"), "hello"]):
+            assert extract_text_from_file(path) is None
+            assert extract_text_from_file(path) == "hello"
+    
+    def test_upload_stream_hits_cache(self):
+        """Streams with the same bytes should be extracted once, from the start."""
+        def fake_extract(stream):
+            assert stream.tell() == 0
+            return "pdf text"
+        
+        with patch("rag.utils._extract_text_from_pdf", side_effect=fake_extract) as mock_extract:
+            assert extract_text_from_pdf(io.BytesIO(b"%PDF-same")) == "pdf text"
+            assert extract_text_from_pdf(io.BytesIO(b"%PDF-same")) == "pdf text"
+        
+        assert mock_extract.call_count == 1
+    
+    def test_pdf_bytes_not_copied_without_pool(self):
+        """Without a process pool, large PDFs should not be buffered for workers."""
+        from pypdf import PdfWriter
+        from rag.utils import _extract_text_from_pdf
+        
+        writer = PdfWriter()
+        for _ in range(20):
+            writer.add_blank_page(width=72, height=72)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        buffer.seek(0)
+        
+        with patch("rag.utils._pdf_pool", None), \
+             patch("rag.utils._extract_pdf_pages", return_value=[]) as mock_pages:
+            _extract_text_from_pdf(buffer)
+        
+        assert mock_pages.call_args.args[1] is None
+    
+    def test_failed_upload_is_not_cached(self):
+        """A failed stream extraction should be retried on the next call."""
+        with patch("rag.utils._extract_text_from_pdf", side_effect=[ValueError("bad"), "pdf text"]):
+            with pytest.raises(ValueError):
+                extract_text_from_pdf(io.BytesIO(b"%PDF-same"))
+            assert extract_text_from_pdf(io.BytesIO(b"%PDF-same")) == "pdf text"
+
+
 class TestRAGIndexer:
     """Tests for RAGIndexer class."""
     
     @pytest.fixture
     def mock_indexer(self):
         """Create a mocked RAGIndexer."""
-        with patch('rag.indexing.QdrantClient') as mock_qdrant, \
-             patch('rag.indexing.AsyncIOMotorClient') as mock_mongo, \
-             patch('rag.indexing.AsyncOpenAI') as mock_openai:
+        with patch('rag.indexing.get_qdrant') as mock_qdrant, \
+             patch('rag.indexing.get_mongo') as mock_mongo, \
+             patch('rag.indexing.get_openai') as mock_openai:
             
             # Mock Qdrant
-            mock_qdrant_instance = MagicMock()
+            mock_qdrant_instance = AsyncMock()
             mock_qdrant_instance.get_collections.return_value = MagicMock(collections=[])
             mock_qdrant.return_value = mock_qdrant_instance
             
@@ -114,6 +392,14 @@ class TestRAGIndexer:
             
             yield indexer
     
+    @pytest.mark.asyncio
+    async def test_initialize_creates_collection(self, mock_indexer):
+        """Initialization should create the Qdrant collection when missing."""
+        await mock_indexer.initialize()
+        
+        mock_indexer.qdrant_client.create_collection.assert_awaited_once()
+        assert mock_indexer.qdrant_client.create_payload_index.await_count == 2
+    
     @pytest.mark.asyncio
     async def test_generate_embeddings(self, mock_indexer):
         """Test embedding generation."""
@@ -131,6 +417,40 @@ class TestRAGIndexer:
         assert len(embeddings) == 2
         assert len(embeddings[0]) == 1536
     
+    @pytest.mark.asyncio
+    async def test_generate_embeddings_batched(self, mock_indexer):
+        """Batched embeddings should come back in input order."""
+        async def fake_create(model, input, **kwargs):
+            return MagicMock(data=[MagicMock(embedding=[float(len(t))]) for t in input])
+        
+        mock_indexer.openai_client.embeddings.create = AsyncMock(side_effect=fake_create)
+        
+        texts = ["ccc", "a", "bbbb", "dd"]
+        with patch.object(settings, "embed_batch_size", 2):
+            embeddings = await mock_indexer.generate_embeddings(texts)
+        
+        assert mock_indexer.openai_client.embeddings.create.await_count == 2
+        assert embeddings == [[3.0], [1.0], [4.0], [2.0]]
+    
+    @pytest.mark.asyncio
+    async def test_generate_embeddings_disk_cache(self, mock_indexer, tmp_path):
+        """Cached texts should be served from disk without an API call."""
+        from rag.embedding_cache import EmbeddingCache
+        
+        async def fake_create(model, input, **kwargs):
+            return MagicMock(data=[MagicMock(embedding=[float(len(t)), 0.5]) for t in input])
+        
+        mock_indexer.openai_client.embeddings.create = AsyncMock(side_effect=fake_create)
+        mock_indexer._embedding_cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), "test-model")
+        
+        first = await mock_indexer.generate_embeddings(["aa", "bbb"])
+        second = await mock_indexer.generate_embeddings(["bbb", "c"])
+        
+        assert first == [[2.0, 0.5], [3.0, 0.5]]
+        assert second == [[3.0, 0.5], [1.0, 0.5]]
+        assert mock_indexer.openai_client.embeddings.create.await_args.kwargs["input"] == ["c"]
+        mock_indexer._embedding_cache.close()
+    
     @pytest.mark.asyncio
     async def test_index_empty_document(self, mock_indexer):
         """Test indexing with empty content."""
@@ -139,3 +459,122 @@ class TestRAGIndexer:
         
         assert result["status"] == "error"
         assert "Empty" in result["message"]
+    
+    @pytest.mark.asyncio
+    async def test_index_documents_batch(self, mock_indexer):
+        """Batch indexing should aggregate results and map exceptions to errors."""
+        async def fake_index(doc):
+            if doc["source"] == "bad":
+                raise RuntimeError("boom")
+            return {"status": "success", "source": doc["source"], "chunks_indexed": 2}
+        
+        mock_indexer.index_document = fake_index
+        
+        result = await mock_indexer.index_documents([
+            {"source": "a", "content": "x"},
+            {"source": "bad", "content": "x"},
+            {"source": "b", "content": "x"}
+        ])
+        
+        assert result["successful"] == 2
+        assert result["failed"] == 1
+        assert result["total_chunks"] == 4
+        assert [d["source"] for d in result["details"]] == ["a", "bad", "b"]
+        assert result["details"][1]["message"] == "boom"
+    
+    @pytest.mark.asyncio
+    async def test_reindex_skips_unchanged_chunks(self, mock_indexer):
+        """Re-indexing identical content should not re-embed or re-upsert chunks."""
+        stored = {}
+        
+        def fake_upsert(collection_name, points, wait):
+            for point in points:
+                stored[point.id] = point.payload
+        
+        def fake_retrieve(collection_name, ids, with_payload, with_vectors):
+            return [MagicMock(id=i, payload=stored[i]) for i in ids if i in stored]
+        
+        mock_indexer.qdrant_client.upsert.side_effect = fake_upsert
+        mock_indexer.qdrant_client.retrieve.side_effect = fake_retrieve
+        collection = MagicMock(update_one=AsyncMock())
+        mock_indexer.mongo_db = MagicMock()
+        mock_indexer.mongo_db.__getitem__ = MagicMock(return_value=collection)
+        
+        async def fake_create(model, input, **kwargs):
+            return MagicMock(data=[MagicMock(embedding=[0.1] * 1536) for _ in input])
+        
+        mock_indexer.openai_client.embeddings.create = AsyncMock(side_effect=fake_create)
+        
+        doc = {"source": "test", "content": "Sentence number one. " * 100}
+        first = await mock_indexer.index_document(doc)
+        calls_after_first = mock_indexer.openai_client.embeddings.create.await_count
+        second = await mock_indexer.index_document(doc)
+        
+        assert first["status"] == "success"
+        assert second["status"] == "success"
+        assert second["chunks_indexed"] == first["chunks_indexed"]
+        assert mock_indexer.openai_client.embeddings.create.await_count == calls_after_first
+        assert mock_indexer.qdrant_client.upsert.call_count == 1
+        assert collection.update_one.await_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_reindex_shorter_document_deletes_stale_chunks(self, mock_indexer):
+        """Re-indexing fewer chunks should delete the document's higher chunk indices."""
+        async def fake_create(model, input, **kwargs):
+            return MagicMock(data=[MagicMock(embedding=[0.1] * 1536) for _ in input])
+        
+        mock_indexer.openai_client.embeddings.create = AsyncMock(side_effect=fake_create)
+        mock_indexer.qdrant_client.retrieve.return_value = []
+        
+        # Same first 500 characters, so the same document ID
+        content = "Sentence number one. " * 100
+        first = await mock_indexer.index_document({"source": "test", "content": content})
+        second = await mock_indexer.index_document({"source": "test", "content": content[:len(content) // 2]})
+        
+        assert second["document_id"] == first["document_id"]
+        assert second["chunks_indexed"] < first["chunks_indexed"]
+        
+        stale_filter = mock_indexer.qdrant_client.delete.await_args.kwargs["points_selector"].filter
+        document_cond, index_cond = stale_filter.must
+        assert document_cond.key == "document_id"
+        assert document_cond.match.value == second["document_id"]
+        assert index_cond.key == "chunk_index"
+        assert index_cond.range.gte == second["chunks_indexed"]
+    
+    @pytest.mark.asyncio
+    async def test_upsert_points_sub_batches(self, mock_indexer):
+        """Points should be upserted in sub-batches, waiting only on the last."""
+        points = [MagicMock() for _ in range(5)]
+        
+        with patch("rag.indexing.UPSERT_BATCH_SIZE", 2):
+            await mock_indexer._upsert_points(points)
+        
+        calls = mock_indexer.qdrant_client.upsert.await_args_list
+        assert [len(c.kwargs["points"]) for c in calls] == [2, 2, 1]
+        assert [c.kwargs["wait"] for c in calls] == [False, False, True]
+    
+    @pytest.mark.asyncio
+    async def test_batch_metadata_bulk_write(self, mock_indexer):
+        """Batch indexing should flush document metadata with one bulk write."""
+        collection = MagicMock(bulk_write=AsyncMock(), update_one=AsyncMock())
+        mock_indexer.mongo_db = MagicMock()
+        mock_indexer.mongo_db.__getitem__ = MagicMock(return_value=collection)
+        
+        async def fake_create(model, input, **kwargs):
+            return MagicMock(data=[MagicMock(embedding=[0.1] * 1536) for _ in input])
+        
+        mock_indexer.openai_client.embeddings.create = AsyncMock(side_effect=fake_create)
+        mock_indexer.qdrant_client.retrieve.return_value = []
+        
+        result = await mock_indexer.index_documents([
+            {"source": "a", "content": "First document content."},
+            {"source": "b", "content": "Second document content."}
+        ])
+        
+        assert result["successful"] == 2
+        collection.update_one.assert_not_awaited()
+        collection.bulk_write.assert_awaited_once()
+        operations = collection.bulk_write.await_args.args[0]
+        assert len(operations) == 2
+        assert collection.bulk_write.await_args.kwargs["ordered"] is False
+
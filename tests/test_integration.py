@@ -2,11 +2,15 @@
 Integration Tests for RAG Chatbot API.
 """
 
+import asyncio
+from datetime import datetime
+
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock, AsyncMock
 
 from main import app
+from api.routes import get_indexer, get_retriever
 
 
 class TestAPIEndpoints:
@@ -14,8 +18,11 @@ class TestAPIEndpoints:
     
     @pytest.fixture
     def client(self):
-        """Create test client."""
-        return TestClient(app)
+        """Create test client with mocked RAG components."""
+        app.dependency_overrides[get_indexer] = lambda: MagicMock()
+        app.dependency_overrides[get_retriever] = lambda: MagicMock()
+        yield TestClient(app)
+        app.dependency_overrides.clear()
     
     def test_root_endpoint(self, client):
         """Test root endpoint."""
@@ -32,8 +39,7 @@ class TestAPIEndpoints:
         data = response.json()
         assert data["status"] == "healthy"
     
-    @patch('api.routes.get_retriever')
-    def test_query_endpoint(self, mock_get_retriever, client):
+    def test_query_endpoint(self, client):
         """Test query endpoint."""
         # Mock retriever
         mock_retriever = MagicMock()
@@ -53,7 +59,7 @@ class TestAPIEndpoints:
             "processing_time_ms": 100,
             "status": "success"
         })
-        mock_get_retriever.return_value = mock_retriever
+        app.dependency_overrides[get_retriever] = lambda: mock_retriever
         
         response = client.post(
             "/api/v1/query",
@@ -65,8 +71,34 @@ class TestAPIEndpoints:
         assert data["answer"] == "Test answer"
         assert data["status"] == "success"
     
-    @patch('api.routes.get_indexer')
-    def test_index_endpoint(self, mock_get_indexer, client):
+    def test_search_endpoint(self, client):
+        """Test search endpoint."""
+        mock_retriever = MagicMock()
+        mock_retriever.search_similar_documents = AsyncMock(return_value=[
+            {
+                "text": "Test text",
+                "source": "test",
+                "url": "http://example.com",
+                "document_id": "doc123",
+                "chunk_index": 0,
+                "score": 0.9,
+                "metadata": {}
+            }
+        ])
+        app.dependency_overrides[get_retriever] = lambda: mock_retriever
+        
+        response = client.post(
+            "/api/v1/search",
+            json={"query": "What is this?"}
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total_results"] == 1
+        assert data["results"][0]["document_id"] == "doc123"
+        assert "metadata" not in data["results"][0]
+    
+    def test_index_endpoint(self, client):
         """Test indexing endpoint."""
         # Mock indexer
         mock_indexer = MagicMock()
@@ -85,7 +117,7 @@ class TestAPIEndpoints:
                 }
             ]
         })
-        mock_get_indexer.return_value = mock_indexer
+        app.dependency_overrides[get_indexer] = lambda: mock_indexer
         
         response = client.post(
             "/api/v1/index",
@@ -104,6 +136,152 @@ class TestAPIEndpoints:
         assert data["successful"] == 1
         assert data["total_chunks"] == 5
     
+    @pytest.mark.asyncio
+    async def test_streaming_query_not_buffered_by_gzip(self):
+        """With gzip accepted, the sources event should arrive before the stream ends."""
+        release = asyncio.Event()
+        
+        async def events():
+            yield {"type": "sources", "sources": []}
+            await release.wait()
+            yield {"type": "done", "answer": "", "processing_time_ms": 1}
+        
+        mock_retriever = MagicMock()
+        mock_retriever.query = AsyncMock(return_value=events())
+        app.dependency_overrides[get_retriever] = lambda: mock_retriever
+        
+        request_body = b'{"query": "What is this?", "stream": true}'
+        messages = asyncio.Queue()
+        incoming = [{"type": "http.request", "body": request_body, "more_body": False}]
+        finished = asyncio.Event()
+        
+        async def receive():
+            if incoming:
+                return incoming.pop()
+            # The response listens for a disconnect while it streams
+            await finished.wait()
+            return {"type": "http.disconnect"}
+        
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/api/v1/query",
+            "raw_path": b"/api/v1/query",
+            "query_string": b"",
+            "root_path": "",
+            "headers": [
+                (b"host", b"testserver"),
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(request_body)).encode()),
+                (b"accept-encoding", b"gzip")
+            ],
+            "client": ("testclient", 50000),
+            "server": ("testserver", 80)
+        }
+        
+        try:
+            app_task = asyncio.create_task(app(scope, receive, messages.put))
+            
+            start = await asyncio.wait_for(messages.get(), timeout=5)
+            assert dict(start["headers"])[b"content-encoding"] == b"identity"
+            
+            # Only release the generator once the first event has been received
+            first = await asyncio.wait_for(messages.get(), timeout=5)
+            assert b'"sources"' in first["body"]
+            assert first["more_body"]
+            
+            release.set()
+            while (await asyncio.wait_for(messages.get(), timeout=5)).get("more_body", False):
+                pass
+            finished.set()
+            await asyncio.wait_for(app_task, timeout=5)
+        finally:
+            release.set()
+            finished.set()
+            app.dependency_overrides.clear()
+    
+    def test_history_endpoint(self, client):
+        """Test chat history endpoint."""
+        mock_retriever = MagicMock()
+        mock_retriever.get_chat_history = AsyncMock(return_value=[
+            {
+                "_id": "abc",
+                "session_id": "session123",
+                "query": "What is this?",
+                "answer": "Test answer",
+                "sources": [],
+                "status": "success",
+                "processing_time_ms": 100,
+                "timestamp": datetime(2024, 1, 1, 12, 0, 0)
+            }
+        ])
+        app.dependency_overrides[get_retriever] = lambda: mock_retriever
+        
+        response = client.get("/api/v1/history/session123")
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["session_id"] == "session123"
+        assert data["total_entries"] == 1
+        assert data["history"][0]["answer"] == "Test answer"
+        assert data["history"][0]["timestamp"] == "2024-01-01T12:00:00"
+    
+    def test_history_endpoint_incomplete_entries(self, client):
+        """Missing fields get defaults; unserializable entries become a 500."""
+        mock_retriever = MagicMock()
+        mock_retriever.get_chat_history = AsyncMock(return_value=[{"query": "What is this?"}])
+        app.dependency_overrides[get_retriever] = lambda: mock_retriever
+        
+        response = client.get("/api/v1/history/session123")
+        
+        assert response.status_code == 200
+        entry = response.json()["history"][0]
+        assert entry["answer"] == ""
+        assert entry["sources"] == []
+        assert entry["processing_time_ms"] == 0
+        
+        mock_retriever.get_chat_history = AsyncMock(return_value=[{"sources": object()}])
+        
+        response = client.get("/api/v1/history/session123")
+        
+        assert response.status_code == 500
+    
+    def test_upload_text_file(self, client):
+        """Test text file upload."""
+        response = client.post(
+            "/api/v1/upload",
+            files={"file": ("notes.txt", b"Hello from a text file.", "text/plain")}
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["text"] == "Hello from a text file."
+        assert data["type"] == "txt"
+    
+    @patch('api.routes.MAX_FILE_SIZE_MB', 0)
+    def test_upload_too_large(self, client):
+        """Oversized uploads should be rejected with 413."""
+        response = client.post(
+            "/api/v1/upload",
+            files={"file": ("notes.txt", b"Hello from a text file.", "text/plain")}
+        )
+        
+        assert response.status_code == 413
+        assert "detail" in response.json()
+    
+    def test_upload_empty_text_file(self, client):
+        """Uploads with no extractable text should be rejected with 422."""
+        response = client.post(
+            "/api/v1/upload",
+            files={"file": ("empty.txt", b"", "text/plain")}
+        )
+        
+        assert response.status_code == 422
+        assert response.json()["detail"] == "Empty text extracted from document."
+    
     def test_query_validation(self, client):
         """Test query validation."""
         # Empty query should fail
@@ -168,3 +346,29 @@ class TestAPIModels:
         )
         assert len(request.documents) == 1
         assert request.documents[0].source == "test"
+
+    def test_request_models_frozen(self):
+        """Request models should ignore unknown fields and reject mutation."""
+        from pydantic import ValidationError
+        from api.models import QueryRequest
+
+        request = QueryRequest(query="Test", unknown="ignored")
+        assert not hasattr(request, "unknown")
+
+        with pytest.raises(ValidationError):
+            request.top_k = 5
+
+
+class TestAPIResponses:
+    """Tests for custom response classes."""
+    
+    def test_fast_orjson_response_numpy(self):
+        """FastORJSONResponse should serialize numpy values."""
+        import numpy as np
+        from api.responses import FastORJSONResponse
+        
+        response = FastORJSONResponse(content={
+            "score": np.float32(0.5),
+            "vector": np.array([1.0, 2.0], dtype=np.float32)
+        })
+        assert response.body == b'{"score":0.5,"vector":[1.0,2.0]}'
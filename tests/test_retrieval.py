@@ -2,9 +2,12 @@
 Tests for RAG Retrieval Module.
 """
 
+import asyncio
+
 import pytest
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
 from rag.retrieval import RAGRetriever
+from config.settings import settings
 
 
 class TestRAGRetriever:
@@ -13,12 +16,12 @@ class TestRAGRetriever:
     @pytest.fixture
     def mock_retriever(self):
         """Create a mocked RAGRetriever."""
-        with patch('rag.retrieval.QdrantClient') as mock_qdrant, \
-             patch('rag.retrieval.AsyncIOMotorClient') as mock_mongo, \
-             patch('rag.retrieval.AsyncOpenAI') as mock_openai:
+        with patch('rag.retrieval.get_qdrant') as mock_qdrant, \
+             patch('rag.retrieval.get_mongo') as mock_mongo, \
+             patch('rag.retrieval.get_openai') as mock_openai:
             
             # Mock Qdrant
-            mock_qdrant_instance = MagicMock()
+            mock_qdrant_instance = AsyncMock()
             mock_qdrant.return_value = mock_qdrant_instance
             
             # Mock MongoDB
@@ -46,6 +49,19 @@ class TestRAGRetriever:
         
         assert len(embedding) == 1536
     
+    @pytest.mark.asyncio
+    async def test_query_embedding_cache(self, mock_retriever):
+        """Repeated normalized queries should hit the embedding cache."""
+        mock_response = MagicMock()
+        mock_response.data = [MagicMock(embedding=[0.5] * 1536)]
+        mock_retriever.openai_client.embeddings.create = AsyncMock(return_value=mock_response)
+        
+        first = await mock_retriever.generate_query_embedding("Test query")
+        second = await mock_retriever.generate_query_embedding("  test QUERY ")
+        
+        assert first == second
+        assert mock_retriever.openai_client.embeddings.create.await_count == 1
+    
     @pytest.mark.asyncio
     async def test_retrieve_no_results(self, mock_retriever):
         """Test retrieval when no documents match."""
@@ -55,7 +71,7 @@ class TestRAGRetriever:
         mock_retriever.openai_client.embeddings.create = AsyncMock(return_value=mock_response)
         
         # Mock Qdrant search returning empty
-        mock_retriever.qdrant_client.search.return_value = []
+        mock_retriever.qdrant_client.query_points.return_value = MagicMock(points=[])
         
         results = await mock_retriever.retrieve_relevant_documents("test query")
         
@@ -80,7 +96,7 @@ class TestRAGRetriever:
             "metadata": {}
         }
         mock_result.score = 0.95
-        mock_retriever.qdrant_client.search.return_value = [mock_result]
+        mock_retriever.qdrant_client.query_points.return_value = MagicMock(points=[mock_result])
         
         results = await mock_retriever.retrieve_relevant_documents("test query")
         
@@ -121,7 +137,7 @@ class TestRAGRetriever:
             "metadata": {}
         }
         mock_search_result.score = 0.9
-        mock_retriever.qdrant_client.search.return_value = [mock_search_result]
+        mock_retriever.qdrant_client.query_points.return_value = MagicMock(points=[mock_search_result])
         
         # Mock LLM response
         mock_llm_response = MagicMock()
@@ -148,7 +164,7 @@ class TestRAGRetriever:
         mock_retriever.openai_client.embeddings.create = AsyncMock(return_value=mock_response)
         
         # Mock Qdrant returning no results
-        mock_retriever.qdrant_client.search.return_value = []
+        mock_retriever.qdrant_client.query_points.return_value = MagicMock(points=[])
         
         # Mock MongoDB
         mock_retriever.mongo_db = MagicMock()
@@ -158,3 +174,117 @@ class TestRAGRetriever:
         
         assert result["status"] == "no_results"
         assert result["sources"] == []
+    
+    @pytest.mark.asyncio
+    async def test_query_semantic_cache_hit(self, mock_retriever):
+        """A cached response for a similar query should skip the LLM."""
+        mock_response = MagicMock()
+        mock_response.data = [MagicMock(embedding=[0.1] * 1536)]
+        mock_retriever.openai_client.embeddings.create = AsyncMock(return_value=mock_response)
+        mock_retriever.openai_client.chat.completions.create = AsyncMock()
+        
+        cache_hit = MagicMock()
+        cache_hit.payload = {
+            "answer": "Cached answer",
+            "sources": [],
+            "documents_retrieved": 2,
+            "filter_source": "",
+            "ts": 0
+        }
+        mock_retriever.qdrant_client.query_points.return_value = MagicMock(points=[cache_hit])
+        
+        with patch.object(settings, "semantic_cache_enabled", True):
+            result = await mock_retriever.query("What is this?")
+        
+        assert result["status"] == "cache_hit"
+        assert result["answer"] == "Cached answer"
+        # Cache lookup and retrieval run side by side
+        assert mock_retriever.qdrant_client.query_points.call_count == 2
+        mock_retriever.openai_client.chat.completions.create.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_query_cache_write_in_background(self, mock_retriever):
+        """A cache miss should return before the cache write completes."""
+        mock_embed_response = MagicMock()
+        mock_embed_response.data = [MagicMock(embedding=[0.1] * 1536)]
+        mock_retriever.openai_client.embeddings.create = AsyncMock(return_value=mock_embed_response)
+
+        mock_search_result = MagicMock()
+        mock_search_result.payload = {
+            "text": "Relevant content",
+            "source": "source1",
+            "url": "http://example.com",
+            "document_id": "doc1",
+            "chunk_index": 0,
+            "metadata": {}
+        }
+        mock_search_result.score = 0.9
+
+        async def query_points(collection_name, **kwargs):
+            if collection_name == settings.qdrant_collection:
+                return MagicMock(points=[mock_search_result])
+            return MagicMock(points=[])
+
+        mock_retriever.qdrant_client.query_points.side_effect = query_points
+
+        mock_llm_response = MagicMock()
+        mock_llm_response.choices = [MagicMock(message=MagicMock(content="The answer is..."))]
+        mock_retriever.openai_client.chat.completions.create = AsyncMock(return_value=mock_llm_response)
+
+        release = asyncio.Event()
+
+        async def slow_upsert(**kwargs):
+            await release.wait()
+
+        mock_retriever.qdrant_client.upsert.side_effect = slow_upsert
+
+        with patch.object(settings, "semantic_cache_enabled", True):
+            result = await asyncio.wait_for(mock_retriever.query("What is this?"), timeout=5)
+
+        assert result["status"] == "success"
+        assert mock_retriever._bg_tasks
+
+        release.set()
+        await asyncio.gather(*mock_retriever._bg_tasks)
+
+        upsert_kwargs = mock_retriever.qdrant_client.upsert.await_args.kwargs
+        assert upsert_kwargs["points"][0].payload["answer"] == "The answer is..."
+
+
+    @pytest.mark.asyncio
+    async def test_query_pipeline_streaming(self, mock_retriever):
+        """Streaming queries should emit sources, token deltas, then done."""
+        mock_embed_response = MagicMock()
+        mock_embed_response.data = [MagicMock(embedding=[0.1] * 1536)]
+        mock_retriever.openai_client.embeddings.create = AsyncMock(return_value=mock_embed_response)
+        
+        mock_search_result = MagicMock()
+        mock_search_result.payload = {
+            "text": "Relevant content",
+            "source": "source1",
+            "url": "http://example.com",
+            "document_id": "doc1",
+            "chunk_index": 0,
+            "metadata": {}
+        }
+        mock_search_result.score = 0.9
+        mock_retriever.qdrant_client.query_points.return_value = MagicMock(points=[mock_search_result])
+        
+        async def token_stream():
+            for delta in ("The ", "answer", None):
+                yield MagicMock(choices=[MagicMock(delta=MagicMock(content=delta))])
+        
+        mock_retriever.openai_client.chat.completions.create = AsyncMock(return_value=token_stream())
+        
+        insert_one = AsyncMock()
+        mock_retriever.mongo_db = MagicMock()
+        mock_retriever.mongo_db.__getitem__ = MagicMock(return_value=MagicMock(insert_one=insert_one))
+        
+        events = await mock_retriever.query("What is this?", session_id="s1", stream=True)
+        events = [event async for event in events]
+        await asyncio.gather(*mock_retriever._bg_tasks)
+        
+        assert [e["type"] for e in events] == ["sources", "token", "token", "done"]
+        assert events[0]["sources"][0]["source"] == "source1"
+        assert events[-1]["status"] == "success"
+        assert insert_one.await_args.args[0]["answer"] == "The answer"